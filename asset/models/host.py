@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from .mapping import DiskStatusMapping, IPStatusMapping
 from common.models import ManageModel
 from .network import IP
@@ -37,9 +37,18 @@ class Host(ManageModel):
     idc = models.CharField(max_length=32, verbose_name='所在机房')
 
     def post_delete(self):
-        disk_ids = DiskHost.dao.get_field_value('disk_id', host_id=self.uuid)
-        dq = Disk.dao.get_queryset().filter(uuid__in=disk_ids)
-        Disk.dao.bulk_update_obj(dq, status=DiskStatusMapping.index('空闲'))
-        DiskHost.dao.bulk_delete_obj(host_id=self.uuid)
-        iq = IP.dao.get_queryset(host=self.uuid)
-        IP.dao.bulk_update_obj(iq, host=None, status=IPStatusMapping.index('空闲'), used_to_sync=False)
+        self.post_delete_many([self])
+
+    @classmethod
+    def post_delete_many(cls, objects: list):
+        """
+        释放被删除主机占用的磁盘和 ip，无论主机数量多少都只执行固定的几条语句
+        """
+        host_uuids = [obj.uuid for obj in objects]
+        with transaction.atomic():
+            disk_ids = DiskHost.dao.get_field_value('disk_id', host_id__in=host_uuids)
+            dq = Disk.dao.get_queryset(uuid__in=disk_ids)
+            Disk.dao.bulk_update_obj(dq, status=DiskStatusMapping.index('空闲'))
+            DiskHost.dao.bulk_delete_obj(host_id__in=host_uuids)
+            iq = IP.dao.get_queryset(host__in=host_uuids)
+            IP.dao.bulk_update_obj(iq, host=None, status=IPStatusMapping.index('空闲'), used_to_sync=False)
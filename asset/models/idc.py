@@ -16,6 +16,9 @@ class IDC(ManageModel):
     region = models.CharField(db_index=True, max_length=64, verbose_name='地区')
     is_enabled = models.BooleanField(default=True, verbose_name="是否激活")
 
+    # 数据量小且很少变化，缓存按 uuid 查询的对象
+    dao_cache_size = 1024
+
     def pre_delete(self):
         host = Host.dao.get_queryset(idc=self.uuid)
         disk = Disk.dao.get_queryset(idc=self.uuid)
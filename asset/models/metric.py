@@ -13,3 +13,6 @@ class Metric(ManageModel):
     type = models.SmallIntegerField(verbose_name='指标类型')
     comment = models.CharField(max_length=64, verbose_name='指标描述', null=True, blank=True)
 
+    # 数据量小且很少变化，缓存按 uuid 查询的对象
+    dao_cache_size = 1024
+
@@ -17,6 +17,9 @@ class Project(ManageModel):
     enabled = models.BooleanField(default=True, verbose_name='是否启用')
     comment = models.TextField(null=True, verbose_name='备注')
 
+    # 数据量小且很少变化，缓存按 uuid 查询的对象
+    dao_cache_size = 1024
+
     def pre_delete(self):
         host = Host.dao.get_queryset(project=self.uuid)
         if host:
@@ -12,6 +12,10 @@ class DisKSizeField(CharField):
     def to_representation(self, value):
         return f'{value} G'
 
+    @staticmethod
+    def to_representation_column(values: list) -> list:
+        return [None if value is None else f'{value} G' for value in values]
+
 
 class DiskSerializer(BulkSerializerMixin, ManageSerializer):
     """
@@ -1,6 +1,7 @@
 from rest_framework.serializers import *
 from utils import generate_unique_uuid, hash_string, logger
 from typing import List
+from collections import defaultdict
 from common.serializers import *
 from common.fields import *
 from utils import CreateObjectError
@@ -20,6 +21,10 @@ class MemorySerializer(IntegerField):
         value = f'{round(super().to_representation(value)/1024, 2)} G'
         return value
 
+    @staticmethod
+    def to_representation_column(values: list) -> list:
+        return [None if value is None else f'{round(int(value)/1024, 2)} G' for value in values]
+
 
 class HostSerializer(BulkSerializerMixin, ManageSerializer):
     """
@@ -29,6 +34,8 @@ class HostSerializer(BulkSerializerMixin, ManageSerializer):
         list_serializer_class = BulkListSerializer
         fields = '__all__'
         model = Host
+        # 需要通过 include 参数展开的关联字段
+        expandable_fields = ('ips', 'disks')
 
     ssh_port = IntegerField(max_value=65536, min_value=22)
     type = TypeIntegerField(mapping=HostTypeMapping, min_value=0)
@@ -54,12 +61,53 @@ class HostSerializer(BulkSerializerMixin, ManageSerializer):
     idc = LogicalForeignField(model=IDC)
     project = LogicalForeignField(model=Project)
 
-    @staticmethod
-    def get_ips(obj):
-        host_uuid = obj.uuid
-        ins = IP.dao.get_queryset(host=host_uuid)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 列表序列化时批量预取的 ip 和磁盘数据，按主机 uuid 分组
+        self._ips_by_host = None
+        self._disks_by_host = None
+
+    def prefetch_related_data(self, instances: list):
+        """
+        一次性查询本页所有主机的 ip、磁盘关联和磁盘，并在内存中按主机分组
+        """
+        host_uuids = [obj.uuid for obj in instances]
+        readable = {field.field_name for field in self._readable_fields}
+
+        if 'ips' in readable:
+            ips = list(IP.dao.get_queryset(host__in=host_uuids))
+            self._ips_by_host = defaultdict(list)
+            for ip, data in zip(ips, self.serialize_ips(ips)):
+                self._ips_by_host[ip.host].append(data)
+
+        if 'disks' in readable:
+            host_ids_by_disk = defaultdict(list)
+            for link in DiskHost.dao.get_queryset(host_id__in=host_uuids):
+                host_ids_by_disk[link.disk_id].append(link.host_id)
+            disks = list(Disk.dao.get_queryset(uuid__in=host_ids_by_disk.keys()))
+            self._disks_by_host = defaultdict(list)
+            for disk, data in zip(disks, self.serialize_disks(disks)):
+                for host_id in host_ids_by_disk[disk.uuid]:
+                    self._disks_by_host[host_id].append(data)
+
+    def get_ips(self, obj):
+        if self._ips_by_host is not None:
+            return self._ips_by_host.get(obj.uuid, [])
+        ins = IP.dao.get_queryset(host=obj.uuid)
+        return self.serialize_ips(ins)
+
+    def get_disks(self, obj):
+        if self._disks_by_host is not None:
+            return self._disks_by_host.get(obj.uuid, [])
+        disk_ids = DiskHost.dao.get_field_value('disk_id', host_id=obj.uuid)
+        ins = Disk.dao.get_queryset().filter(uuid__in=disk_ids)
+        return self.serialize_disks(ins)
+
+    def serialize_ips(self, ins):
+        # 共享上下文，使协商的渲染器对时间字段的处理与主机一致
         serializer = IPSerializer(
             ins,
+            context=self.context,
             standalone=True,
             exclude_fields=(
                 'created_at',
@@ -69,13 +117,11 @@ class HostSerializer(BulkSerializerMixin, ManageSerializer):
             many=True)
         return serializer.data
 
-    @staticmethod
-    def get_disks(obj):
-        host_uuid = obj.uuid
-        disk_ids = DiskHost.dao.get_field_value('disk_id', host_id=host_uuid)
-        ins = Disk.dao.get_queryset().filter(uuid__in=disk_ids)
+    def serialize_disks(self, ins):
+        # 共享上下文，使协商的渲染器对时间字段的处理与主机一致
         serializer = DiskSerializer(
             ins,
+            context=self.context,
             standalone=True,
             exclude_fields=(
                 'created_at',
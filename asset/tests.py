@@ -0,0 +1,49 @@
+from unittest import mock
+from django.test import TestCase
+from .models import Metric
+
+
+def _run_on_commit(func, using=None):
+    """
+    测试用例运行在不提交的事务中，事务提交后的回调改为立即执行
+    """
+    func()
+
+
+class BulkWriteGenerationTest(TestCase):
+    """
+    批量写入整批只递增一次数据版本号
+    """
+
+    def setUp(self):
+        on_commit = mock.patch('django.db.transaction.on_commit', side_effect=_run_on_commit)
+        bump = mock.patch('common.models.bump_generation')
+        on_commit.start()
+        self.bump = bump.start()
+        self.addCleanup(on_commit.stop)
+        self.addCleanup(bump.stop)
+
+        self.fields_list = [
+            {'name': f'metric{i}', 'type': 0, 'created_by': '0' * 32}
+            for i in range(20)
+        ]
+
+    def test_bulk_create(self):
+        Metric.dao.bulk_create_obj(self.fields_list)
+        self.bump.assert_called_once_with(Metric._meta.label)
+
+    def test_bulk_update(self):
+        objects = Metric.dao.bulk_create_obj(self.fields_list)
+        objects = list(Metric.dao.get_queryset(uuid__in=[obj.uuid for obj in objects]))
+        self.bump.reset_mock()
+
+        Metric.dao.bulk_update_obj(objects, comment='updated')
+        self.bump.assert_called_once_with(Metric._meta.label)
+
+    def test_bulk_delete(self):
+        objects = Metric.dao.bulk_create_obj(self.fields_list)
+        objects = list(Metric.dao.get_queryset(uuid__in=[obj.uuid for obj in objects]))
+        self.bump.reset_mock()
+
+        Metric.dao.delete_objs(objects)
+        self.bump.assert_called_once_with(Metric._meta.label)
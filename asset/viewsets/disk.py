@@ -15,3 +15,5 @@ class DiskViewSet(BulkManageViewSet):
     queryset = Disk.objects.all()
     serializer_class = DiskSerializer
     lookup_field = 'uuid'
+    # 列表数据量大，使用 values() 快速序列化
+    values_serialization = True
@@ -15,3 +15,5 @@ class HealthViewSet(BulkManageViewSet):
     queryset = MonitorData.objects.all()
     serializer_class = HealthSerializer
     lookup_field = 'uuid'
+    # 列表数据量大，使用 values() 快速序列化
+    values_serialization = True
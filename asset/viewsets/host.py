@@ -1,5 +1,5 @@
 from common.viewsets import BulkManageViewSet
-from ..models import Host
+from ..models import Host, IP, Disk, DiskHost
 from ..serializer import HostSerializer
 
 
@@ -31,4 +31,8 @@ class HostViewSet(HostAbstractViewSet):
     queryset = Host.objects.all()
     serializer_class = HostSerializer
     lookup_field = 'uuid'
+    # 列表数据量大，使用 values() 快速序列化
+    values_serialization = True
+    # include=ips,disks 展开的关联数据
+    cache_related_models = (IP, Disk, DiskHost)
     query_param_disallowed = ['cpu']
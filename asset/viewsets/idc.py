@@ -15,4 +15,6 @@ class IDCViewSet(BulkManageViewSet):
     queryset = IDC.objects.all()
     serializer_class = IDCSerializer
     lookup_field = 'uuid'
+    # 数据很少变化，读取频繁，缓存响应
+    response_cache_timeout = 300
     search_fields = ('name',)
@@ -15,3 +15,5 @@ class MetricViewSet(BulkManageViewSet):
     queryset = Metric.objects.all()
     serializer_class = MetricSerializer
     lookup_field = 'uuid'
+    # 数据很少变化，读取频繁，缓存响应
+    response_cache_timeout = 300
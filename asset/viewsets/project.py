@@ -15,3 +15,5 @@ class ProjectViewSet(BulkManageViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     lookup_field = 'uuid'
+    # 数据很少变化，读取频繁，缓存响应
+    response_cache_timeout = 300
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 from corsheaders.defaults import default_headers
+from MySQLdb.cursors import SSCursor
 from .configs import CFG
 
 import os
@@ -96,6 +97,13 @@ DATABASES = {
         'ATOMIC_REQUESTS': True
     }
 }
+# 流式返回大列表使用的只读连接，服务端游标逐行读取结果集，不在客户端缓存整个结果集，
+# 默认的游标会把结果集全部读入内存，iterator 只能分块序列化，不能降低内存占用
+DATABASES['stream'] = dict(
+    DATABASES['default'],
+    ATOMIC_REQUESTS=False,
+    OPTIONS={'cursorclass': SSCursor},
+    TEST={'MIRROR': 'default'})
 #
 
 # 国际化配置
@@ -141,6 +149,19 @@ REST_FRAMEWORK = {
     'UNAUTHENTICATED_USER': 'common.auth.AnonymousUser',
     # 时间格式
     'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
+    # 响应渲染器，json 使用 orjson 编码，机器客户端可通过 Accept 或 format 参数协商 msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'common.renderers.JSONRenderer',
+        'common.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+    # 请求解析器，json 使用 orjson 解码
+    'DEFAULT_PARSER_CLASSES': [
+        'common.parsers.JSONParser',
+        'common.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser'
+    ],
     # 查询过滤器
     'DEFAULT_FILTER_BACKENDS': [
         'common.filters.QueryFilterBackend',
@@ -228,6 +249,24 @@ LOGGER = 'django'
 REDIS_HOST = CFG.get('redis', 'REDIS_HOST')
 REDIS_PORT = CFG.get('redis', 'REDIS_PORT')
 
+# 缓存后端配置，lru 为进程内 LRU 缓存，redis 为 Redis 缓存，
+# 响应缓存、条件请求和对象缓存只在 redis 后端时开启
+_CACHE_BACKEND = CFG.get('cache', 'backend', fallback='lru')
+_CACHE_OPTIONS = {
+    'lru': {
+        'max_size': 4096
+    },
+    'redis': {
+        'host': REDIS_HOST,
+        'port': REDIS_PORT,
+        'db': CFG.get('cache', 'redis_db', fallback=1)
+    }
+}
+CACHE_BACKEND = {
+    'BACKEND': _CACHE_BACKEND,
+    'OPTIONS': _CACHE_OPTIONS.get(_CACHE_BACKEND, {})
+}
+
 # Channel 配置
 CHANNEL_LAYERS = {
     'default': {
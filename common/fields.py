@@ -81,6 +81,13 @@ class TypeIntegerField(IntegerField):
         value = super().to_representation(value)
         return self.mapping[value]
 
+    def to_representation_column(self, values: list) -> list:
+        """
+        整列解析为映射，空值保持为 None
+        """
+        mapping = self.mapping
+        return [None if value is None else mapping[int(value)] for value in values]
+
 
 class LogicalForeignField(CharField):
     """
@@ -92,6 +99,10 @@ class LogicalForeignField(CharField):
         self.is_attached = True
         self.display_fields = display_fields
         self.exclude_fields = exclude_fields
+        # 批量预取的关联对象，uuid 到对象的映射
+        self.prefetched = None
+        # 批量预取时查询过的 uuid，不在预取结果中即不存在
+        self.checked = None
         kwargs['trim_whitespace'] = True
         kwargs['max_length'] = 32
         kwargs['min_length'] = 32
@@ -100,6 +111,12 @@ class LogicalForeignField(CharField):
     def run_validation(self, data=''):
         data = super().run_validation(data)
 
+        # 已经过批量存在性验证的 uuid 无需再次查询
+        if self.prefetched is not None and data in self.prefetched:
+            return data
+        if self.checked is not None and data in self.checked:
+            raise ValidationError(f'uuid `{data}` is not found')
+
         try:
             self.model.dao.get_obj(uuid=data)
         except DAOException:
@@ -110,13 +127,33 @@ class LogicalForeignField(CharField):
     def to_internal_value(self, data):
         return super().to_internal_value(data)
 
+    def get_related_obj(self, value):
+        """
+        获取关联对象，优先使用批量预取的结果
+        :param value: 关联对象的 uuid
+        :return: 模型对象
+        """
+        if self.prefetched is not None and value in self.prefetched:
+            return self.prefetched[value]
+        return self.model.dao.get_obj(uuid=value)
+
+    @property
+    def is_expanded(self) -> bool:
+        """
+        是否展开为关联对象，由序列化器的 expand_fields 决定，否则只输出 uuid
+        """
+        return self.field_name in getattr(self.parent, 'expand_fields', ())
+
     def to_representation(self, value):
+        if not self.is_expanded:
+            return super().to_representation(value)
         if self.allow_blank and not value:
             return {}
         value = super().to_representation(value)
-        obj = self.model.dao.get_obj(uuid=value)
+        obj = self.get_related_obj(value)
         if self.display_fields is None:
-            d = obj.__dict__
+            # 复制一份字段字典，避免修改到被复用的对象
+            d = dict(obj.__dict__)
             del d['_state']
             if self.exclude_fields:
                 for i in self.exclude_fields:
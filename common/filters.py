@@ -1,11 +1,18 @@
+from typing import Optional, FrozenSet, Tuple
+from collections import namedtuple
+from functools import lru_cache
 from rest_framework.filters import BaseFilterBackend
 from django.db import models
 import re
 
 
+# 解析后的查询条目，字段、查询类型、值列表和是否取反
+QueryTerm = namedtuple('QueryTerm', ['key', 'lookup', 'values', 'negative'])
+
+
 class QueryFilterBackend(BaseFilterBackend):
     """
-    查询参数过滤器
+    查询参数过滤器，查询语句被解析和编译为查询对象后按语句缓存
     """
 
     _query_param = 'query'
@@ -19,95 +26,145 @@ class QueryFilterBackend(BaseFilterBackend):
         '^': 'istartswith',
         '$': 'iendswith'
     }
-
-    def check_disallowed_query_param(self, query_terms, view):
-        if hasattr(view, 'query_param_disallowed'):
-            disallowed_query_fields = view.query_param_disallowed
-            for param in query_terms:
-                for qt in self._query_types.keys():
-                    ls = param.split(qt)
-                    field = ls[0]
-                    assert field not in disallowed_query_fields, f'{field} not allowed in this query'
+    # 解析和编译结果的缓存容量
+    _cache_size = 1024
 
     def filter_queryset(self, request, queryset, view):
         """
         过滤器的入口
         """
-        query_fields = self._get_query_fields(view, request)
-        query_terms = self._get_query_terms(request)
-        self.check_disallowed_query_param(query_terms, view)
-
-        if not query_fields or not query_terms:
+        query = self._get_query_string(request)
+        if not query:
             return queryset
 
-        q = self._construct_query(query_fields, query_terms.pop())
-        while query_terms:
-            if query_terms.pop() == ',':
-                q &= self._construct_query(query_fields, query_terms.pop())
-            else:
-                q |= self._construct_query(query_fields, query_terms.pop())
+        terms, operators = self._parse(query)
+        self.check_disallowed_query_param(terms, view)
 
-        return queryset.filter(q)
+        query_fields = self._get_query_fields(view)
+        if not query_fields:
+            return queryset
+
+        return queryset.filter(self._compile(query, query_fields))
 
-    @ staticmethod
-    def _get_query_fields(view, request):
+    @staticmethod
+    def check_disallowed_query_param(terms: Tuple[Optional[QueryTerm], ...], view):
+        """
+        检查查询条目中不包含视图禁止查询的字段
+        """
+        disallowed_query_fields = getattr(view, 'query_param_disallowed', None)
+        if not disallowed_query_fields:
+            return
+        for term in terms:
+            if term is not None:
+                assert term.key not in disallowed_query_fields, f'{term.key} not allowed in this query'
+
+    @staticmethod
+    def _get_query_fields(view) -> FrozenSet[str]:
         """
         模型的所有字段
         """
         model = getattr(getattr(view, 'queryset', None), 'model', None)
-        fields = getattr(model, 'get_field_names')()
-        fields.remove('id')
-        return fields
+        return _get_model_query_fields(model)
 
-    def _get_query_terms(self, request):
+    def _get_query_string(self, request) -> str:
         """
-        分离查询的条目
+        获取标准化的查询语句
         """
         params = request.query_params.get(self._query_param, None)
-        if not params: return []
-        params = params.replace('\x00', '')
-        params_list = re.split(r'(,|`)', params)
-        params_list.reverse()
-        return params_list
+        if not params:
+            return ''
+        return params.replace('\x00', '')
 
-    def _construct_query(self, get_query_fields, query_term) -> models.Q:
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def _parse(cls, query: str) -> Tuple[Tuple[Optional[QueryTerm], ...], Tuple[str, ...]]:
         """
-        构造一个查询条目的对应查询对象
-        :param get_query_fields: 查询字段
-        :param query_term: 查询条目
-        :return: 查询对象
+        解析查询语句为查询条目和连接符，条目间 `,` 表示且，`\\`` 表示或，从左到右结合
+        :param query: 查询语句
+        :return: 查询条目元组和连接符元组
         """
-        q = models.Q()
+        parts = re.split(r'(,|`)', query)
+        terms = tuple(cls._parse_term(part) for part in parts[::2])
+        operators = tuple(parts[1::2])
+        return terms, operators
 
+    @classmethod
+    def _parse_term(cls, query_term: str) -> Optional[QueryTerm]:
+        """
+        解析一个查询条目，无法识别查询类型时返回 None
+        """
         # 确认查询类型，分离键值
-        lookup = None
-        for flag in self._query_types:
+        for flag, lookup in cls._query_types.items():
             if flag in query_term:
-                lookup = flag
                 break
+        else:
+            return None
 
-        if lookup is None:
-            return q
-        t = self._query_types[lookup]
-
-        key, values_str = query_term.split(lookup, 1)
+        key, values_str = query_term.split(flag, 1)
 
         # 从键中记录并去除取反标记
-        negative = False
-        if key[0] == '!':
+        negative = key.startswith('!')
+        if negative:
             key = key[1:]
-            negative = True
 
-        # 根据查询类型生成查询对象
-        if key in get_query_fields and values_str:
-            if t != '':
-                key += f'__{t}'
-            values = values_str.split('|')
-            for value in values:
-                q |= models.Q(**{key: value})
+        values = tuple(values_str.split('|')) if values_str else ()
+        return QueryTerm(key, lookup, values, negative)
+
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def _compile(cls, query: str, query_fields: FrozenSet[str]) -> models.Q:
+        """
+        编译查询语句为查询对象
+        :param query: 查询语句
+        :param query_fields: 允许查询的字段
+        :return: 查询对象
+        """
+        terms, operators = cls._parse(query)
+        q = cls._construct_query(query_fields, terms[0])
+        for operator, term in zip(operators, terms[1:]):
+            if operator == ',':
+                q &= cls._construct_query(query_fields, term)
+            else:
+                q |= cls._construct_query(query_fields, term)
+        return q
+
+    @staticmethod
+    def _construct_query(query_fields: FrozenSet[str], term: Optional[QueryTerm]) -> models.Q:
+        """
+        构造一个查询条目的对应查询对象
+        :param query_fields: 查询字段
+        :param term: 查询条目
+        :return: 查询对象
+        """
+        q = models.Q()
+        if term is None:
+            return q
+
+        # 根据查询类型生成查询对象，同一字段的多个等值查询合并为 in 查询
+        if term.key in query_fields and term.values:
+            if term.lookup == '':
+                values = list(dict.fromkeys(term.values))
+                if len(values) == 1:
+                    q = models.Q(**{term.key: values[0]})
+                else:
+                    q = models.Q(**{f'{term.key}__in': values})
+            else:
+                key = f'{term.key}__{term.lookup}'
+                for value in term.values:
+                    q |= models.Q(**{key: value})
 
         # 确定是否取反
-        if negative:
+        if term.negative:
             return ~q
         else:
             return q
+
+
+@lru_cache(maxsize=None)
+def _get_model_query_fields(model) -> FrozenSet[str]:
+    """
+    模型允许查询的字段，每个模型只计算一次
+    """
+    fields = set(getattr(model, 'get_field_names')())
+    fields.discard('id')
+    return frozenset(fields)
@@ -33,14 +33,17 @@ class LoggingMiddleware(MiddlewareMixin):
             'request': request
         }
 
+        # 流式响应的内容只能被消费一次，不记录长度
+        size = '-' if response.streaming else len(response.getvalue())
+
         exc = getattr(response, 'with_exception', None)
         if exc:
             message = f'"{request.method} {request.get_full_path()}" "{exc.status_code} {exc.__class__.__name__}"' \
-                      f' {len(response.getvalue())} {duration}'
+                      f' {size} {duration}'
             log_kwargs.update(level='error')
         else:
             message = f'"{request.method} {request.get_full_path()}" "{response.status_code} {response.reason_phrase}"' \
-                      f' {len(response.getvalue())} {duration}'
+                      f' {size} {duration}'
 
         log_response(message, **log_kwargs)
 
@@ -1,15 +1,26 @@
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, Iterable, List, Set, Tuple
 from rest_framework.response import Response
 from rest_framework.views import set_rollback
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.http.response import HttpResponseBase
 from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import exceptions, status
-from utils import logger
+from utils import logger, get_cache, get_generation, is_shared_cache, hash_string, json_dumps
+from calendar import timegm
+from datetime import datetime
+from functools import lru_cache
+from .fields import LogicalForeignField
+from .serializers import ValuesSerializer
 import sys
 import re
 
 __all__ = [
+    'SparseFieldsMixin',
+    'ResponseCacheMixin',
     'ListModelMixin',
     'BulkCreateModelMixin',
     'BulkUpdateModelMixin',
@@ -19,6 +30,7 @@ __all__ = [
     'UpdateModelMixin',
     'DestroyModelMixin',
     'get_data_response',
+    'get_streaming_data_response',
     'get_error_response',
     'normalized_exception_handler'
 ]
@@ -43,6 +55,50 @@ def get_data_response(data: Union[dict,
     }, **kwargs)
 
 
+def get_streaming_data_response(chunks: Iterable[list],
+                                code: Optional[int] = 200,
+                                **kwargs: Any) -> StreamingHttpResponse:
+    """
+    构造流式返回数据的响应，数据按块编码后逐步输出，格式与 get_data_response 一致
+    第一块在返回响应前求值，查询和序列化的早期异常仍由异常处理返回错误响应，
+    之后的异常记录日志并中断输出，客户端得到不完整的 json 而不是看似完整的部分数据
+    :param chunks: 数据块的可迭代对象，每块是数据列表
+    :param code: 状态码
+    :param kwargs: 包含其他响应参数的字典
+    :return: 流式响应类
+    """
+    def encode(chunk: list) -> bytes:
+        return b','.join(json_dumps(item) for item in chunk)
+
+    chunks = iter(chunks)
+    first_chunk = next(chunks, None)
+    first_content = encode(first_chunk) if first_chunk else None
+
+    def stream():
+        yield b'{"code":' + json_dumps(code) + b',"data":['
+        first = True
+        if first_content is not None:
+            yield first_content
+            first = False
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                content = encode(chunk)
+                yield content if first else b',' + content
+                first = False
+        except Exception:
+            logger.exception('streaming response failed, the response is truncated')
+            return
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        yield b'],"message":null}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json', **kwargs)
+
+
 def get_error_response(message: str, code: int, **kwargs: Any) -> Response:
     """
     构造返回错误的响应
@@ -100,29 +156,394 @@ def normalized_exception_handler(exc: Exception, context: dict):
     return response
 
 
+def _get_version_field(model) -> Optional[str]:
+    """
+    获取模型中能表示数据版本的时间字段
+    """
+    field_names = model.get_field_names()
+    for name in ('updated_at', 'created_at'):
+        if name in field_names:
+            return name
+    return None
+
+
+def _get_generations(models: Iterable[type]) -> List[Tuple[str, int]]:
+    """
+    获取模型的数据版本号，按模型排序去重
+    """
+    labels = sorted({m._meta.label for m in models})
+    return [(label, get_generation(label)) for label in labels]
+
+
+def _get_validators(request,
+                    models: Iterable[type],
+                    *parts: Any,
+                    last_modified: Optional[datetime] = None) -> Tuple[str, Optional[int]]:
+    """
+    计算条件请求的 ETag 和 Last-Modified 时间戳
+    ETag 由依赖模型的数据版本号、额外的版本信息、标准化的查询参数和协商的媒体类型组成
+    :param request: 请求
+    :param models: 响应依赖的模型类
+    :param parts: 额外的版本信息
+    :param last_modified: 最后修改时间
+    :return: 带引号的 ETag 和时间戳
+    """
+    params = sorted(request.query_params.lists())
+    raw = f'{_get_generations(models)}:{parts}:{params}:{request.accepted_media_type}'
+    etag = quote_etag(hash_string(raw))
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    return etag, timestamp
+
+
+def get_list_validators(request, models: Iterable[type], count: int) -> Tuple[str, Optional[int]]:
+    """
+    用依赖模型的数据版本号和总数计算列表条件请求的校验值，不查询数据，列表不提供 Last-Modified，
+    仅在数据版本号由各进程共享时使用
+    """
+    return _get_validators(request, models, count)
+
+
+def get_list_data_validators(request, queryset) -> Tuple[str, Optional[int]]:
+    """
+    用一条聚合查询得到列表的总数和最后修改时间，由数据本身计算条件请求的校验值，不依赖数据版本号
+    """
+    version_field = _get_version_field(queryset.model)
+    aggregations = {'count': Count('pk')}
+    if version_field:
+        aggregations['last_modified'] = Max(version_field)
+    result = queryset.order_by().aggregate(**aggregations)
+    last_modified = result.get('last_modified')
+    return _get_validators(request, (), result['count'], last_modified, last_modified=last_modified)
+
+
+def get_object_validators(request, instance, models: Iterable[type]) -> Tuple[str, Optional[int]]:
+    """
+    用依赖模型的数据版本号、对象的 uuid 和最后修改时间计算条件请求的校验值，
+    响应还依赖其他模型时对象的修改时间不能代表响应的修改时间，不提供 Last-Modified
+    """
+    models = list(models)
+    version_field = _get_version_field(type(instance))
+    last_modified = getattr(instance, version_field) if version_field else None
+    etag, timestamp = _get_validators(request, models, instance.uuid, last_modified, last_modified=last_modified)
+    if len({m._meta.label for m in models}) > 1:
+        timestamp = None
+    return etag, timestamp
+
+
+def set_validators(response: HttpResponseBase, etag: Optional[str], timestamp: Optional[int]) -> HttpResponseBase:
+    """
+    为响应设置 ETag 和 Last-Modified 头部
+    """
+    if etag is None:
+        return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class SparseFieldsMixin:
+    """
+    读取请求支持通过 fields、omit 参数选择返回的字段，并只查询需要的列，
+    所有请求支持通过 include 参数展开关联对象
+    """
+
+    # 只返回的字段参数，逗号分隔
+    fields_query_param = 'fields'
+    # 不返回的字段参数，逗号分隔
+    omit_query_param = 'omit'
+    # 展开的关联字段参数，逗号分隔
+    include_query_param = 'include'
+    # 总是查询的列，用于定位对象和查询关联数据
+    always_loaded_fields = ('uuid',)
+
+    def get_requested_fields(self) -> Tuple[Optional[Set[str]], Set[str]]:
+        """
+        获取请求指定的只返回字段和不返回字段，非读取请求不做限制
+        """
+        if self.request.method not in ('GET', 'HEAD'):
+            return None, set()
+
+        params = self.request.query_params
+        only = params.get(self.fields_query_param)
+        omit = params.get(self.omit_query_param)
+        only = {f.strip() for f in only.split(',') if f.strip()} if only else None
+        omit = {f.strip() for f in omit.split(',') if f.strip()} if omit else set()
+        return only, omit
+
+    def get_included_fields(self) -> Set[str]:
+        """
+        获取请求指定展开的关联字段
+        """
+        include = self.request.query_params.get(self.include_query_param)
+        return {f.strip() for f in include.split(',') if f.strip()} if include else set()
+
+    def get_serializer(self, *args, **kwargs):
+        """
+        裁剪序列化器输出的字段，未请求的方法字段不会被执行
+        """
+        kwargs.setdefault('expand_fields', self.get_included_fields())
+        only, omit = self.get_requested_fields()
+        if only is not None:
+            kwargs.setdefault('only_fields', only)
+        if omit:
+            kwargs['exclude_fields'] = tuple(kwargs.get('exclude_fields', ())) + tuple(omit)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        """
+        用 only 缩小查询的列
+        """
+        queryset = super().get_queryset()
+        loaded_fields = self.get_loaded_fields(queryset)
+        if loaded_fields is not None:
+            queryset = queryset.only(*loaded_fields)
+        return queryset
+
+    def get_always_loaded_fields(self, queryset) -> Set[str]:
+        """
+        总是查询的列，除 always_loaded_fields 外还包括计算 ETag 的版本时间字段和游标分页的有序键，
+        避免读取这些延迟加载的字段时逐个对象额外查询
+        """
+        fields = set(self.always_loaded_fields)
+        version_field = _get_version_field(queryset.model)
+        if version_field:
+            fields.add(version_field)
+        paginator = getattr(self, 'paginator', None)
+        if hasattr(paginator, 'is_cursor_request') and paginator.is_cursor_request(self.request):
+            fields.update(key.lstrip('-') for key in paginator.get_cursor_ordering(queryset, self))
+        return fields
+
+    def get_loaded_fields(self, queryset) -> Optional[List[str]]:
+        """
+        根据请求的字段计算需要查询的列，None 表示查询所有列
+        """
+        only, omit = self.get_requested_fields()
+        if only is None and not omit:
+            return None
+
+        always = self.get_always_loaded_fields(queryset)
+        names = [f.name for f in queryset.model._meta.concrete_fields]
+        if only is not None:
+            return [n for n in names if n in only or n in always]
+        return [n for n in names if n not in omit or n in always]
+
+
+@lru_cache(maxsize=None)
+def _get_logical_foreign_models(serializer_class) -> Tuple[type, ...]:
+    """
+    序列化器中逻辑外键字段关联的模型，每个序列化器类只计算一次
+    """
+    fields = serializer_class().fields.values()
+    return tuple({field.model for field in fields if isinstance(field, LogicalForeignField)})
+
+
+def _to_plain(data: Any) -> Any:
+    """
+    把序列化结果转换为普通的字典和列表，去掉 ReturnDict、ReturnList 对序列化器的引用，便于缓存
+    """
+    if isinstance(data, dict):
+        return {key: _to_plain(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_to_plain(value) for value in data]
+    return data
+
+
+class ResponseCacheMixin:
+    """
+    读请求的响应缓存，键包含视图、用户、路由参数、查询参数、媒体类型和依赖模型的数据版本号，
+    依赖模型的数据变更时版本号递增，缓存自然失效
+    """
+
+    # 响应缓存时间，单位秒，None 表示不缓存，缓存后端不共享时不缓存
+    response_cache_timeout = None
+    # 响应依赖的其他模型，除视图模型和逻辑外键模型外需要手动声明，同时用于计算条件请求的 ETag
+    cache_related_models = ()
+
+    def get_cache_dependencies(self) -> List[type]:
+        """
+        响应依赖的模型列表
+        """
+        models = [self.get_queryset().model]
+        models.extend(_get_logical_foreign_models(self.get_serializer_class()))
+        models.extend(self.cache_related_models)
+        return models
+
+    def get_response_cache_key(self, request) -> Optional[str]:
+        """
+        计算响应缓存的键，不缓存时返回 None，缓存后端不共享时不缓存
+        """
+        if self.response_cache_timeout is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if not is_shared_cache():
+            return None
+
+        # 查询集和权限可能因用户而异，不同用户的响应分开缓存
+        view = f'{type(self).__module__}.{type(self).__qualname__}:{self.action}'
+        user = getattr(request.user, 'pk', None)
+        generations = _get_generations(self.get_cache_dependencies())
+        params = sorted(request.query_params.lists())
+        raw = f'{view}:{user}:{sorted(self.kwargs.items())}:{params}:{request.accepted_media_type}:{generations}'
+        return f'response:{hash_string(raw)}'
+
+    @staticmethod
+    def get_cached(cache_key: Optional[str]) -> Optional[tuple]:
+        """
+        获取缓存的响应数据和校验值
+        """
+        if cache_key is None:
+            return None
+        return get_cache().get(cache_key)
+
+    def set_cached(self, cache_key: Optional[str], data: Any, etag: Optional[str], last_modified: Optional[int]):
+        """
+        缓存响应数据和校验值
+        """
+        if cache_key is not None:
+            get_cache().set(cache_key, (_to_plain(data), etag, last_modified), self.response_cache_timeout)
+
+    @staticmethod
+    def get_cached_response(request, data: Any, etag: Optional[str], last_modified: Optional[int]) -> HttpResponseBase:
+        """
+        用缓存的数据和校验值生成响应，条件请求命中时返回 304
+        """
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+        return set_validators(get_data_response(data), etag, last_modified)
+
+
 # 列表路由的处理混合
-class ListModelMixin:
+class ListModelMixin(ResponseCacheMixin):
     """
     模型对象列表查询
     """
 
+    # 不分页时是否流式返回
+    stream_unpaginated = True
+    # 流式返回时每次从数据库读取并序列化的对象数
+    stream_chunk_size = 1000
+    # 流式返回时读取数据使用的数据库别名，应配置为服务端游标，不存在时使用查询集原来的连接
+    stream_database = 'stream'
+    # 是否支持 If-None-Match、If-Modified-Since 条件请求，游标分页时不支持
+    conditional_get = True
+    # 是否在可读字段都对应模型列时使用 values() 查询和按列转换的快速序列化
+    values_serialization = False
+
     def list(self, request, *args, **kwargs):
+        # 命中响应缓存则不访问数据库
+        cache_key = self.get_response_cache_key(request)
+        cached = self.get_cached(cache_key)
+        if cached is not None:
+            return self.get_cached_response(request, *cached)
+
         # 过滤对象
         queryset = self.filter_queryset(self.get_queryset())
 
+        # 数据未变化则不查询和序列化，直接返回 304
+        etag = last_modified = None
+        if self.conditional_get and not self.is_cursor_request(request):
+            etag, last_modified = self.get_list_validators(request, queryset)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+        # 使用快速序列化时只查询需要的列，不实例化模型对象
+        values_serializer = self.get_values_serializer()
+        if values_serializer is not None:
+            queryset = queryset.values(*self.get_values_fields(values_serializer, queryset))
+
         # 获取分页对象列表
         page = self.paginate_queryset(queryset)
 
-        # 列表不为空则返回分页数据，否则返回包含所有对象的数据
+        # 列表不为空则返回分页数据，否则返回包含所有对象的数据，需要缓存时不流式返回
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            data = self.get_paginated_response(serializer.data)
+            data = self.get_paginated_response(self.serialize_many(page, values_serializer))
+        elif cache_key is None and self.is_streamable(request):
+            # 不分页时用服务端游标分块读取和序列化，内存占用与结果集大小无关
+            response = get_streaming_data_response(self.iter_serialized_chunks(queryset, values_serializer))
+            return set_validators(response, etag, last_modified)
         else:
-            serializer = self.get_serializer(queryset, many=True)
-            data = serializer.data
+            data = self.serialize_many(queryset, values_serializer)
 
-        # 返回响应
-        return get_data_response(data)
+        # 缓存并返回响应
+        self.set_cached(cache_key, data, etag, last_modified)
+        return set_validators(get_data_response(data), etag, last_modified)
+
+    def get_list_validators(self, request, queryset) -> Tuple[str, Optional[int]]:
+        """
+        计算列表条件请求的校验值，数据版本号由各进程共享时用版本号和缓存的总数，不查询数据，
+        否则用总数和最后修改时间的聚合查询
+        """
+        if is_shared_cache():
+            return get_list_validators(request, self.get_cache_dependencies(), self.get_count(queryset))
+        return get_list_data_validators(request, queryset)
+
+    def is_cursor_request(self, request) -> bool:
+        """
+        请求是否使用游标分页
+        """
+        paginator = self.paginator
+        return paginator is not None and hasattr(paginator, 'is_cursor_request') and paginator.is_cursor_request(request)
+
+    def get_count(self, queryset) -> int:
+        """
+        获取列表总数，优先使用分页器的总数缓存，分页时不会重复统计
+        """
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_count'):
+            return paginator.get_count(queryset, self.request)
+        return queryset.count()
+
+    def is_streamable(self, request) -> bool:
+        """
+        是否流式返回，仅在协商结果为 json 时启用
+        """
+        renderer = getattr(request, 'accepted_renderer', None)
+        return self.stream_unpaginated and getattr(renderer, 'format', None) == 'json'
+
+    def iter_serialized_chunks(self, queryset, values_serializer: Optional[ValuesSerializer] = None):
+        """
+        用 iterator 分块读取查询集，逐块序列化
+        mysql 默认的游标会在客户端缓存整个结果集，使用服务端游标的连接读取时内存占用才与结果集大小无关
+        """
+        if self.stream_database in settings.DATABASES:
+            queryset = queryset.using(self.stream_database)
+        chunk = []
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= self.stream_chunk_size:
+                yield self.serialize_many(chunk, values_serializer)
+                chunk = []
+        if chunk:
+            yield self.serialize_many(chunk, values_serializer)
+
+    def get_values_serializer(self) -> Optional[ValuesSerializer]:
+        """
+        获取快速序列化器，未开启或序列化器存在不对应模型列的可读字段时返回 None
+        """
+        if not self.values_serialization:
+            return None
+        return ValuesSerializer.from_serializer(self.get_serializer())
+
+    def get_values_fields(self, values_serializer: ValuesSerializer, queryset) -> List[str]:
+        """
+        values() 需要查询的字段，包括游标分页使用的有序键
+        """
+        fields = values_serializer.value_fields
+        get_cursor_ordering = getattr(self.paginator, 'get_cursor_ordering', None)
+        if get_cursor_ordering is not None:
+            fields.extend(key.lstrip('-') for key in get_cursor_ordering(queryset, self))
+        return list(dict.fromkeys(fields))
+
+    def serialize_many(self, objects, values_serializer: Optional[ValuesSerializer] = None) -> list:
+        """
+        序列化对象列表，存在快速序列化器时按列转换 values() 的结果行
+        """
+        if values_serializer is not None:
+            return values_serializer.to_representation(objects)
+        return self.get_serializer(objects, many=True).data
 
 
 class BulkCreateModelMixin:
@@ -204,7 +625,7 @@ class BulkUpdateModelMixin:
             if _id:
                 id_list.append(_id)
             else:
-                raise ValidationError(
+                raise exceptions.ValidationError(
                     f'All objects to update must have `{lookup_url_kwarg}`')
 
         # 进行查询集过滤
@@ -213,7 +634,7 @@ class BulkUpdateModelMixin:
 
         # 检查需找到所有对象
         if len(update_queryset) != len(id_list):
-            raise ValidationError('Could not find all objects to update.')
+            raise exceptions.ValidationError('Could not find all objects to update.')
 
         return update_queryset
 
@@ -291,30 +712,70 @@ class BulkDestroyModelMixin:
         instance.pre_delete()
         instance.delete()
         instance.post_delete()
+        type(instance).mark_changed()
 
     def perform_bulk_destroy(self, objects):
         """
-        执行批量删除
+        执行批量删除，删除语句和钩子都以批量方式执行，
+        视图重写了 perform_destroy 时逐个调用，不跳过视图的删除逻辑
+        """
+        objects = list(objects)
+        if not objects:
+            return
+        if self.overrides_perform_destroy():
+            for obj in objects:
+                self.perform_destroy(obj)
+        else:
+            type(objects[0]).dao.delete_objs(objects)
+
+    @classmethod
+    def overrides_perform_destroy(cls) -> bool:
+        """
+        判断视图是否重写了 perform_destroy，删除混合类中的实现不算在内
         """
-        for obj in objects:
-            self.perform_destroy(obj)
+        for klass in cls.__mro__:
+            if 'perform_destroy' in vars(klass):
+                return klass not in (BulkDestroyModelMixin, DestroyModelMixin)
+        return False
 
 
 ##### 详情路由的处理混合 #####
 
 
-class RetrieveModelMixin:
+class RetrieveModelMixin(ResponseCacheMixin):
     """
     单个模型对象查询
     """
 
+    # 是否支持 If-None-Match、If-Modified-Since 条件请求
+    conditional_get = True
+
     def retrieve(self, request, *args, **kwargs):
-        # 获取对象并序列化
+        # 获取对象，对象的查询范围和权限检查不能被缓存跳过
         instance = self.get_object()
+
+        # 命中响应缓存则不序列化
+        cache_key = self.get_response_cache_key(request)
+        cached = self.get_cached(cache_key)
+        if cached is not None:
+            return self.get_cached_response(request, *cached)
+
+        # 对象未变化则不序列化，直接返回 304
+        etag = last_modified = None
+        if self.conditional_get:
+            # 数据版本号只在本进程有效时只由对象本身计算
+            models = self.get_cache_dependencies() if is_shared_cache() else ()
+            etag, last_modified = get_object_validators(request, instance, models)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+        # 序列化
         serializer = self.get_serializer(instance)
 
-        # 返回响应
-        return get_data_response(serializer.data)
+        # 缓存并返回响应
+        self.set_cached(cache_key, serializer.data, etag, last_modified)
+        return set_validators(get_data_response(serializer.data), etag, last_modified)
 
 
 class CreateModelMixin:
@@ -409,3 +870,4 @@ class DestroyModelMixin:
         instance.pre_delete()
         instance.delete()
         instance.post_delete()
+        type(instance).mark_changed()
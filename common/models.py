@@ -1,6 +1,7 @@
-from django.db import models
+from typing import List
+from django.db import models, transaction
 from django.db.models.base import ModelBase
-from utils import DAO, generate_unique_uuid
+from utils import DAO, generate_unique_uuid, bump_generation
 
 
 __all__ = [
@@ -30,6 +31,11 @@ class BaseModel(models.Model, metaclass=BaseModelMeta):
         verbose_name = '基础抽象模型'
         abstract = True
 
+    # DAO 按 uuid 查询的对象缓存容量，0 表示不缓存
+    dao_cache_size = 0
+    # DAO 对象缓存的过期时间，单位秒
+    dao_cache_timeout = 300
+
     @classmethod
     def pre_create(cls, data: dict):
         """
@@ -69,6 +75,82 @@ class BaseModel(models.Model, metaclass=BaseModelMeta):
         """
         pass
 
+    @classmethod
+    def pre_create_many(cls, data_list: List[dict]):
+        """
+        批量创建对象前的操作，默认逐个调用 pre_create，可重写为基于集合的逻辑
+        :param data_list: 创建数据列表
+        """
+        for data in data_list:
+            cls.pre_create(data)
+
+    @classmethod
+    def post_create_many(cls, objects: list):
+        """
+        批量创建对象后的操作，默认逐个调用 post_create
+        :param objects: 模型对象列表
+        """
+        for obj in objects:
+            obj.post_create()
+
+    @classmethod
+    def pre_update_many(cls, objects: list, data_list: List[dict]):
+        """
+        批量更新对象前的操作，默认逐个调用 pre_update
+        :param objects: 模型对象列表
+        :param data_list: 与对象一一对应的更新数据列表
+        """
+        for obj, data in zip(objects, data_list):
+            obj.pre_update(data)
+
+    @classmethod
+    def post_update_many(cls, objects: list):
+        """
+        批量更新对象后的操作，默认逐个调用 post_update
+        :param objects: 模型对象列表
+        """
+        for obj in objects:
+            obj.post_update()
+
+    @classmethod
+    def pre_delete_many(cls, objects: list):
+        """
+        批量删除对象前的操作，默认逐个调用 pre_delete
+        :param objects: 模型对象列表
+        """
+        for obj in objects:
+            obj.pre_delete()
+
+    @classmethod
+    def post_delete_many(cls, objects: list):
+        """
+        批量删除对象后的操作，默认逐个调用 post_delete
+        :param objects: 模型对象列表
+        """
+        for obj in objects:
+            obj.post_delete()
+
+    @classmethod
+    def mark_changed(cls):
+        """
+        标记模型数据已变更，使依赖该模型的缓存失效，由写入路径（DAO 和序列化器的保存）每次写入调用一次，
+        钩子中不调用，批量写入不会逐行递增版本号
+        在事务提交后才递增版本号，避免并发读取把未提交前的数据缓存到新版本下
+        """
+        label = cls._meta.label
+        transaction.on_commit(lambda: bump_generation(label))
+
+    @classmethod
+    def overrides_hook(cls, name: str) -> bool:
+        """
+        判断模型是否重写了指定的钩子，公共抽象模型中的实现不算在内
+        :param name: 钩子名
+        """
+        for klass in cls.__mro__:
+            if name in vars(klass):
+                return klass not in (BaseModel, DisplayModel, ManageModel)
+        return False
+
     @classmethod
     def get_field_names(cls):
         """
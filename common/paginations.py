@@ -1,11 +1,79 @@
-from typing import Optional
+from typing import Optional, List, Tuple
 from django.views import View
 from rest_framework.request import Request
 from rest_framework.pagination import PageNumberPagination, replace_query_param
 from rest_framework.exceptions import NotFound
-from django.core.paginator import InvalidPage
-from django.db.models import QuerySet
+from django.core.paginator import InvalidPage, Paginator
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Field, QuerySet, Q
+from django.utils.functional import cached_property
 from collections import OrderedDict
+from utils import LRUCache, get_generation, hash_string
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import binascii
+import json
+
+
+class CountCachedPaginator(Paginator):
+    """
+    总数带缓存的分页器，缓存以模型、数据版本号和过滤条件为键，模型数据变更后自动失效
+    """
+
+    # 进程内的总数缓存
+    count_cache = LRUCache(max_size=1024)
+
+    def __init__(self, object_list, per_page, count_timeout: int = 0, estimate: bool = False, **kwargs):
+        """
+        初始化
+        :param count_timeout: 总数缓存时间，单位秒，0 表示不缓存
+        :param estimate: 是否允许对无过滤条件的查询使用表统计信息估算总数
+        """
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_timeout = count_timeout
+        self.estimate = estimate
+
+    @cached_property
+    def count(self) -> int:
+        """
+        获取总数，优先使用缓存
+        """
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or not self.count_timeout:
+            return super().count
+
+        # 排序和查询的列不影响总数，去掉排序并只选主键后以查询语句作为过滤条件的标准形式
+        queryset = queryset.order_by()
+        try:
+            sql, params = queryset.values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        model = queryset.model
+        estimate = self.estimate and not queryset.query.where
+        key = (model._meta.label, get_generation(model._meta.label), estimate, hash_string(f'{sql}{params}'))
+        count = self.count_cache.get(key)
+        if count is None:
+            count = self.get_estimated_count(queryset) if estimate else queryset.count()
+            self.count_cache.set(key, count, self.count_timeout)
+        return count
+
+    @staticmethod
+    def get_estimated_count(queryset: QuerySet) -> int:
+        """
+        使用表统计信息估算无过滤条件的总数，仅支持 mysql，其他数据库精确统计
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'mysql':
+            return queryset.count()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else queryset.count()
 
 
 class PagePagesizePagination(PageNumberPagination):
@@ -23,10 +91,23 @@ class PagePagesizePagination(PageNumberPagination):
     max_page_size = 0
     # 末尾页字符
     last_page_strings = ('last', 'end')
+    # 游标参数，存在时使用基于键集的游标分页，不统计总数
+    cursor_query_param = 'cursor'
+    # 分页器类，总数带缓存
+    django_paginator_class = CountCachedPaginator
+    # 总数缓存时间，单位秒
+    count_cache_timeout = 5
+    # 总数统计方式参数，值为 estimate 时无过滤条件的大表使用表统计信息估算
+    count_query_param = 'count'
 
     def __init__(self) -> None:
         self.page = None
         self.request = None
+        # 游标分页的状态
+        self.cursor_mode = False
+        self.cursor_ordering = None
+        self.next_cursor = None
+        self.previous_cursor = None
 
     def paginate_queryset(self,
                           queryset: QuerySet,
@@ -35,6 +116,10 @@ class PagePagesizePagination(PageNumberPagination):
         """
         对查询集进行分页，成功返回数据列表，否则返回 None
         """
+        # 存在游标参数则使用游标分页
+        if self.is_cursor_request(request):
+            return self.paginate_queryset_by_cursor(queryset, request, view)
+
         # 存在 page 或 page_size 参数则启用分页
         page_number = request.query_params.get(self.page_query_param)
 
@@ -58,7 +143,7 @@ class PagePagesizePagination(PageNumberPagination):
                 return None
 
         # 调用 django 的分页类得到分页器
-        paginator = self.django_paginator_class(queryset, page_size)
+        paginator = self.get_django_paginator(queryset, page_size, request)
         if page_number == -1:
             page_number = paginator.num_pages
 
@@ -77,10 +162,158 @@ class PagePagesizePagination(PageNumberPagination):
         self.page = page
         return list(page)
 
+    def is_cursor_request(self, request: Request) -> bool:
+        """
+        请求是否使用游标分页
+        """
+        return self.cursor_query_param in request.query_params
+
+    def get_django_paginator(self, queryset: QuerySet, page_size: int, request: Request) -> Paginator:
+        """
+        创建 django 的分页器，总数缓存参数由请求决定
+        """
+        return self.django_paginator_class(
+            queryset,
+            page_size,
+            count_timeout=self.count_cache_timeout,
+            estimate=request.query_params.get(self.count_query_param) == 'estimate')
+
+    def get_count(self, queryset: QuerySet, request: Request) -> int:
+        """
+        获取查询集的总数，与分页共用总数缓存，先统计总数再分页时不会重复查询
+        """
+        return self.get_django_paginator(queryset, 1, request).count
+
+    def paginate_queryset_by_cursor(self,
+                                    queryset: QuerySet,
+                                    request: Request,
+                                    view: Optional[View] = None) -> list:
+        """
+        基于键集的游标分页，按唯一的有序键定位，避免 OFFSET 扫描和 COUNT 统计
+        """
+        self.request = request
+        self.cursor_mode = True
+        self.cursor_ordering = self.get_cursor_ordering(queryset, view)
+        page_size = self.get_page_size(request) or self.default_page_size
+
+        # 解析游标，空游标即第一页
+        position, reverse = self.decode_cursor(request.query_params.get(self.cursor_query_param), queryset.model)
+        ordering = self.cursor_ordering
+        if reverse:
+            ordering = [self._reverse_ordering(key) for key in ordering]
+        if position is not None:
+            queryset = queryset.filter(self._get_cursor_filter(ordering, position))
+
+        # 多取一条来判断是否还有数据
+        items = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if reverse:
+            items.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        if items:
+            if has_next:
+                self.next_cursor = self.encode_cursor(self._get_position(items[-1]), False)
+            if has_previous:
+                self.previous_cursor = self.encode_cursor(self._get_position(items[0]), True)
+        return items
+
+    @staticmethod
+    def get_cursor_ordering(queryset: QuerySet, view: Optional[View] = None) -> List[str]:
+        """
+        游标分页使用的有序键，视图可通过 cursor_ordering 指定，最后一个键必须唯一
+        """
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return list(ordering)
+        field_names = queryset.model.get_field_names()
+        key = 'time' if 'time' in field_names else 'created_at'
+        return [f'-{key}', '-id']
+
+    @staticmethod
+    def _reverse_ordering(key: str) -> str:
+        """
+        反转排序方向
+        """
+        return key[1:] if key.startswith('-') else f'-{key}'
+
+    @staticmethod
+    def _get_cursor_filter(ordering: List[str], position: list) -> Q:
+        """
+        构造位于游标之后的数据的查询条件，
+        如 (a, b) 降序时为 a < va OR (a = va AND b < vb)
+        """
+        q = Q()
+        for i, key in enumerate(ordering):
+            lookup = 'lt' if key.startswith('-') else 'gt'
+            condition = Q(**{f'{key.lstrip("-")}__{lookup}': position[i]})
+            for j, prev_key in enumerate(ordering[:i]):
+                condition &= Q(**{prev_key.lstrip('-'): position[j]})
+            q |= condition
+        return q
+
+    def _get_position(self, item) -> list:
+        """
+        获取对象在有序键上的位置，对象可以是模型对象或 values() 的结果行
+        """
+        if isinstance(item, dict):
+            return [item[key.lstrip('-')] for key in self.cursor_ordering]
+        return [getattr(item, key.lstrip('-')) for key in self.cursor_ordering]
+
+    @staticmethod
+    def encode_cursor(position: list, reverse: bool) -> str:
+        """
+        编码为不透明的游标字符串
+        """
+        s = json.dumps({'p': position, 'r': int(reverse)}, default=str)
+        return urlsafe_b64encode(s.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor: Optional[str], model: type) -> Tuple[Optional[list], bool]:
+        """
+        解码游标字符串，得到位置和是否反向，位置按有序键的字段类型转换，无效游标则触发异常
+        """
+        if not cursor:
+            return None, False
+        try:
+            d = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            position, reverse = d['p'], bool(d['r'])
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+            raise NotFound(f'Invalid cursor, the cursor is {cursor}')
+        if not isinstance(position, list) or len(position) != len(self.cursor_ordering):
+            raise NotFound(f'Invalid cursor, the cursor is {cursor}')
+
+        # 客户端可以篡改游标，位置的值必须能转换为有序键对应字段的类型
+        try:
+            position = [
+                self._get_ordering_field(model, key).to_python(value)
+                for key, value in zip(self.cursor_ordering, position)
+            ]
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            raise NotFound(f'Invalid cursor, the cursor is {cursor}')
+        return position, reverse
+
+    @staticmethod
+    def _get_ordering_field(model: type, key: str) -> Field:
+        """
+        获取有序键对应的模型字段
+        """
+        name = key.lstrip('-')
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
     def get_paginated_response(self, data: list) -> OrderedDict:
         """
         得到分页后的响应数据
         """
+        if self.cursor_mode:
+            return OrderedDict([
+                ('current', len(data)),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('data', data)
+            ])
         return OrderedDict([
             ('total', self.page.paginator.count),
             ('current', len(data)),
@@ -89,12 +322,31 @@ class PagePagesizePagination(PageNumberPagination):
             ('data', data)
         ])
 
+    def get_next_link(self):
+        """
+        获取下页链接
+        """
+        if self.cursor_mode:
+            return self._get_cursor_link(self.next_cursor)
+        return super().get_next_link()
+
     def get_previous_link(self):
         """
         获取上页链接
         """
+        if self.cursor_mode:
+            return self._get_cursor_link(self.previous_cursor)
         if not self.page.has_previous():
             return None
         url = self.request.build_absolute_uri()
         page_number = self.page.previous_page_number()
         return replace_query_param(url, self.page_query_param, page_number)
+
+    def _get_cursor_link(self, cursor: Optional[str]) -> Optional[str]:
+        """
+        获取指定游标的链接
+        """
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -0,0 +1,46 @@
+from rest_framework import renderers
+from utils import json_dumps, msgpack_dumps
+
+
+__all__ = [
+    'JSONRenderer',
+    'MessagePackRenderer'
+]
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    使用 utils.codec 编码的 json 渲染器，时间按 DATETIME_FORMAT 格式化，需要缩进时使用框架的实现
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = json_dumps(data)
+        # 与框架保持一致，转义 javascript 中不能出现在字符串字面量里的行分隔符和段分隔符
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    msgpack 渲染器，用于不需要可读格式的机器客户端，时间编码为时间戳
+    """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    # 序列化器不格式化时间字段，由渲染器编码为时间戳
+    native_datetime = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack_dumps(data)
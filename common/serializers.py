@@ -1,9 +1,15 @@
-from rest_framework.serializers import ModelSerializer, CharField
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from collections import defaultdict
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from rest_framework.serializers import ModelSerializer, CharField, Serializer
+from rest_framework.fields import SkipField, SerializerMethodField, DateTimeField, empty
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ListSerializer
 from rest_framework.settings import api_settings
 from rest_framework.utils import html
 from common.models import BaseModel
+from common.fields import LogicalForeignField
 
 
 __all__ = [
@@ -11,7 +17,8 @@ __all__ = [
     'DisplaySerializer',
     'ManageSerializer',
     'BulkSerializerMixin',
-    'BulkListSerializer'
+    'BulkListSerializer',
+    'ValuesSerializer'
 ]
 
 
@@ -19,18 +26,44 @@ class BaseSerializer(ModelSerializer):
     """
     基础序列化器
     """
-    def __init__(self, *args, standalone=False, exclude_fields=(), **kwargs):
+    def __init__(self, *args, standalone=False, exclude_fields=(), only_fields=None, expand_fields=(), **kwargs):
         self._standalone = standalone
         self._exclude_fields = exclude_fields
+        # 只输出的字段，None 表示不限制
+        self._only_fields = only_fields
+        # 需要展开的关联字段，包括逻辑外键和 Meta.expandable_fields 中的字段
+        self.expand_fields = frozenset(expand_fields)
         super().__init__(*args, **kwargs)
 
+    def get_fields(self):
+        """
+        协商的渲染器能原生编码时间时，时间字段不再格式化为字符串
+        """
+        fields = super().get_fields()
+        renderer = getattr(self.context.get('request'), 'accepted_renderer', None)
+        if getattr(renderer, 'native_datetime', False):
+            for field in fields.values():
+                if isinstance(field, DateTimeField):
+                    field.format = None
+        return fields
+
+    def prefetch_related_data(self, instances: list):
+        """
+        列表序列化前批量预取关联数据的钩子，由列表序列化器调用
+        :param instances: 待序列化的对象列表
+        """
+        pass
+
     @property
     def _readable_fields(self):
+        expandable_fields = getattr(self.Meta, 'expandable_fields', ())
         for key, field in self.fields.items():
             if not field.write_only:
                 if not getattr(field, 'is_attached', False) or not self._standalone:
                     if key not in self._exclude_fields:
-                        yield field
+                        if self._only_fields is None or key in self._only_fields:
+                            if key not in expandable_fields or key in self.expand_fields:
+                                yield field
 
     def save(self, **kwargs):
         """
@@ -102,6 +135,8 @@ class BaseSerializer(ModelSerializer):
             )
             self.instance.post_create()
 
+        # 每次保存只标记一次数据变更
+        self.Meta.model.mark_changed()
         return self.instance
 
 
@@ -168,6 +203,9 @@ class BulkListSerializer(ListSerializer):
     2、保存逻辑中加入基础模型中的预处理和后处理
     """
 
+    # 批量写入时每条语句处理的默认对象数
+    batch_size = 500
+
     def to_internal_value(self, data):
         """
         各个数据放入子序列化器中验证
@@ -192,6 +230,9 @@ class BulkListSerializer(ListSerializer):
                 api_settings.NON_FIELD_ERRORS_KEY: [message]
             }, code='empty')
 
+        # 批量查询逻辑外键指向的对象，子序列化器验证时不再逐个查询
+        self.prefetch_logical_foreign_values(data)
+
         # 将各个数据放入子序列化器中验证
         ret = []
         errors = []
@@ -199,10 +240,7 @@ class BulkListSerializer(ListSerializer):
             try:
                 # 区分是否当前是否为更新操作
                 if self.instance is not None:
-                    view = self.context.get('view')
-                    id_attr = view.lookup_url_kwarg or view.lookup_field
-                    instance = self.instance.get(**{id_attr: item[id_attr]})
-                    self.child.instance = instance
+                    self.child.instance = self.get_instance(item.get(self.id_attr))
                 validated = self.child.run_validation(item)
             except ValidationError as exc:
                 errors.append(exc.detail)
@@ -218,6 +256,96 @@ class BulkListSerializer(ListSerializer):
 
         return ret
 
+    @property
+    def id_attr(self) -> str:
+        """
+        批量更新时用于定位对象的字段名
+        """
+        view = self.context.get('view')
+        return view.lookup_url_kwarg or view.lookup_field
+
+    def get_instance(self, _id):
+        """
+        从已求值的更新查询集构建的映射中获取对象，避免逐个查询
+        :param _id: 定位字段的值
+        :return: 模型对象
+        """
+        id_attr = self.id_attr
+        instance_map = getattr(self, '_instance_map', None)
+        if instance_map is None:
+            instance_map = {getattr(obj, id_attr): obj for obj in self.instance}
+            self._instance_map = instance_map
+
+        try:
+            return instance_map[_id]
+        except KeyError:
+            raise ValidationError(f'Could not find object with {id_attr} `{_id}` to update')
+
+    def prefetch_logical_foreign_values(self, data: list):
+        """
+        收集整个请求数据中的逻辑外键值，每个关联模型只进行一次 uuid__in 查询，
+        不存在的 uuid 与格式错误等其他错误一起在子序列化器验证时按数据位置报告
+        :param data: 请求数据列表
+        """
+        values_by_field = {}
+        for field in self.child._writable_fields:
+            if not isinstance(field, LogicalForeignField):
+                continue
+            values = []
+            for item in data:
+                value = field.get_value(item) if isinstance(item, dict) else None
+                value = value.strip() if isinstance(value, str) else None
+                # 格式不正确的值由字段报告格式错误，无需查询
+                values.append(value if value and len(value) == 32 else None)
+            values_by_field[field] = values
+        self._prefetch_related_objects(values_by_field)
+
+    def to_representation(self, data):
+        """
+        序列化前批量预取逻辑外键的关联对象，避免逐行查询
+        """
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        items = list(iterable)
+        self.prefetch_logical_foreign_fields(items)
+        self.child.prefetch_related_data(items)
+        return [self.child.to_representation(item) for item in items]
+
+    def prefetch_logical_foreign_fields(self, items: list):
+        """
+        收集所有对象中需要展开的逻辑外键值，每个关联模型只进行一次 uuid__in 查询
+        :param items: 待序列化的对象列表
+        """
+        values_by_field = {}
+        for field in self.child._readable_fields:
+            if not isinstance(field, LogicalForeignField) or not field.is_expanded:
+                continue
+            values = []
+            for item in items:
+                try:
+                    values.append(field.get_attribute(item))
+                except SkipField:
+                    continue
+            values_by_field[field] = values
+        self._prefetch_related_objects(values_by_field)
+
+    @staticmethod
+    def _prefetch_related_objects(values_by_field: Dict[LogicalForeignField, Iterable]):
+        """
+        按关联模型合并 uuid 后批量查询，并把结果映射设置到各个字段上
+        :param values_by_field: 字段对应 uuid 列表的字典
+        """
+        uuids_by_model = defaultdict(set)
+        for field, values in values_by_field.items():
+            uuids_by_model[field.model].update(v for v in values if v and isinstance(v, str))
+
+        objs_by_model = {}
+        for model, uuids in uuids_by_model.items():
+            objs_by_model[model] = model.dao.get_many(uuids) if uuids else {}
+
+        for field in values_by_field:
+            field.prefetched = objs_by_model[field.model]
+            field.checked = uuids_by_model[field.model]
+
     def save(self, **kwargs):
         """
         加入对子序列器模型是基础模型的断言
@@ -229,34 +357,78 @@ class BulkListSerializer(ListSerializer):
         )
         super().save(**kwargs)
 
+    def get_batch_size(self) -> int:
+        """
+        批量写入时每条语句处理的对象数，可由子序列化器的 Meta.bulk_batch_size 配置
+        """
+        return getattr(self.child.Meta, 'bulk_batch_size', self.batch_size)
+
     def update(self, queryset, all_validated_data):
         """
         用组建的字典进行批量更新，并加入基础模型中的预处理和后处理
+        修改字段相同的对象合并为一组，每组按批次用一条 bulk_update 语句写入
         """
         # 分离 id 和验证信息
-        view = self.context.get('view')
-        id_attr = view.lookup_url_kwarg or view.lookup_field
         all_validated_data_by_id = {
-            i.pop(id_attr): i
+            i.pop(self.id_attr): i
             for i in all_validated_data
         }
-
-        # 分别对每个对象进行更新
-        updated_objects = []
-        for _id, validated_data in all_validated_data_by_id.items():
-            obj = self.instance.get(**{id_attr: _id})
-
-            # 子序列器执行更新操作
-            obj.pre_update(validated_data)
-            obj = self.child.update(obj, validated_data)
-            obj.post_update()
-            updated_objects.append(obj)
+        model_class = self.child.Meta.model
+        concrete_fields = model_class._meta.concrete_fields
+        field_names = {f.name for f in concrete_fields}
+        auto_now_fields = [f for f in concrete_fields if getattr(f, 'auto_now', False)]
+
+        updated_objects = [self.get_instance(_id) for _id in all_validated_data_by_id]
+        all_validated_data = list(all_validated_data_by_id.values())
+
+        # 批量执行更新前的预处理
+        model_class.pre_update_many(updated_objects, all_validated_data)
+
+        # 设置新值，并按修改的字段集合分组
+        groups = defaultdict(list)
+        for obj, validated_data in zip(updated_objects, all_validated_data):
+            for attr, value in validated_data.items():
+                setattr(obj, attr, value)
+            for f in auto_now_fields:
+                f.pre_save(obj, False)
+            changed = frozenset(attr for attr in validated_data if attr in field_names)
+            groups[changed | {f.name for f in auto_now_fields}].append(obj)
+
+        # 每组分批写入，bulk_update 不会触发 auto_now，上面已手动填充
+        with transaction.atomic():
+            for update_fields, objects in groups.items():
+                if update_fields:
+                    model_class.objects.bulk_update(objects, update_fields, batch_size=self.get_batch_size())
+        model_class.dao.invalidate(*updated_objects)
+
+        # 批量执行更新后的后处理，整批只标记一次数据变更
+        model_class.post_update_many(updated_objects)
+        model_class.mark_changed()
 
         return updated_objects
 
     def create(self, validated_data):
         """
-        加入基础模型中的预处理和后处理
+        分批使用 bulk_create 创建，整个过程在一个事务中
+        模型只自定义了单个对象的创建钩子时，钩子可能依赖前面已创建的数据，退回逐个创建
+        """
+        model_class = self.child.Meta.model
+        if any(model_class.overrides_hook(hook) and not model_class.overrides_hook(f'{hook}_many')
+               for hook in ('pre_create', 'post_create')):
+            return self.create_one_by_one(validated_data)
+
+        created_objects = []
+        batch_size = self.get_batch_size()
+        with transaction.atomic():
+            for start in range(0, len(validated_data), batch_size):
+                objects = model_class.dao.bulk_create_obj(validated_data[start:start + batch_size])
+                created_objects.extend(self._reload_without_pk(objects))
+
+        return created_objects
+
+    def create_one_by_one(self, validated_data):
+        """
+        逐个创建，加入基础模型中的预处理和后处理
         """
         created_objects = []
         model_class = self.child.Meta.model
@@ -266,5 +438,104 @@ class BulkListSerializer(ListSerializer):
             obj = self.child.create(data)
             obj.post_create()
             created_objects.append(obj)
+        model_class.mark_changed()
 
         return created_objects
+
+    def _reload_without_pk(self, objects: list) -> list:
+        """
+        部分数据库的 bulk_create 不会回填主键，此时按 uuid 重新查询一次
+        """
+        if all(obj.pk is not None for obj in objects):
+            return objects
+        model_class = self.child.Meta.model
+        reloaded = model_class.objects.in_bulk([obj.uuid for obj in objects], field_name='uuid')
+        return [reloaded[obj.uuid] for obj in objects]
+
+
+def _convert_column(field, values: list) -> list:
+    """
+    用字段的 to_representation 逐个转换一列的值，空值保持为 None
+    """
+    to_representation = field.to_representation
+    return [None if value is None else to_representation(value) for value in values]
+
+
+class ValuesSerializer:
+    """
+    基于 values() 查询结果的只读快速序列化器
+    从序列化器的可读字段预先编译出每一列的转换函数，按列批量转换，不再为每行实例化模型和逐字段序列化，
+    字段可以定义 to_representation_column(values) 实现整列转换，否则逐个调用 to_representation，输出与原序列化器一致
+    """
+
+    def __init__(self, columns: List[Tuple[str, str, Callable[[list], list]]]):
+        """
+        初始化
+        :param columns: 输出字段名、模型字段名和列转换函数的列表，模型字段名为 None 的列不查询
+        """
+        self._columns = columns
+
+    @classmethod
+    def from_serializer(cls, serializer: BaseSerializer) -> Optional['ValuesSerializer']:
+        """
+        从序列化器编译快速序列化器，存在不对应模型列且无法确定输出的可读字段时返回 None
+        模型上不存在的字段与原序列化器的 get_attribute 一致，允许为空的输出 None，非必填的跳过
+        :param serializer: 不带数据的序列化器
+        :return: 快速序列化器或 None
+        """
+        model = serializer.Meta.model
+        columns = []
+        for field in serializer._readable_fields:
+            # 模型上没有对应属性的字段，如展示型模型上的 created_by
+            if len(field.source_attrs) == 1 and not hasattr(model, field.source_attrs[0]):
+                if field.default is not empty:
+                    return None
+                if field.allow_null:
+                    columns.append((field.field_name, None, lambda values: [None] * len(values)))
+                    continue
+                if not field.required:
+                    continue
+                return None
+
+            # 方法字段、嵌套序列化器和需要展开的逻辑外键依赖模型对象
+            if isinstance(field, (SerializerMethodField, Serializer, ListSerializer)):
+                return None
+            if isinstance(field, LogicalForeignField) and field.is_expanded:
+                return None
+            if len(field.source_attrs) != 1:
+                return None
+            try:
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.is_relation:
+                return None
+
+            convert = getattr(field, 'to_representation_column', None)
+            if convert is None:
+                convert = lambda values, field=field: _convert_column(field, values)
+            columns.append((field.field_name, model_field.attname, convert))
+        return cls(columns)
+
+    @property
+    def value_fields(self) -> List[str]:
+        """
+        需要查询的模型字段名
+        """
+        return list(dict.fromkeys(source for _, source, _ in self._columns if source is not None))
+
+    def to_representation(self, rows: Iterable[dict]) -> List[dict]:
+        """
+        按列转换 values() 的结果行
+        :param rows: values() 查询结果
+        :return: 序列化后的数据列表
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        names = [name for name, _, _ in self._columns]
+        columns = [
+            convert([None] * len(rows) if source is None else [row[source] for row in rows])
+            for _, source, convert in self._columns
+        ]
+        return [dict(zip(names, values)) for values in zip(*columns)]
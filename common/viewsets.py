@@ -9,7 +9,8 @@ __all__ = [
 ]
 
 
-class ManageViewSet(ListModelMixin,
+class ManageViewSet(SparseFieldsMixin,
+                    ListModelMixin,
                     RetrieveModelMixin,
                     CreateModelMixin,
                     UpdateModelMixin,
@@ -21,7 +22,8 @@ class ManageViewSet(ListModelMixin,
     pass
 
 
-class BulkManageViewSet(ListModelMixin,
+class BulkManageViewSet(SparseFieldsMixin,
+                        ListModelMixin,
                         BulkCreateModelMixin,
                         BulkUpdateModelMixin,
                         BulkDestroyModelMixin,
@@ -35,7 +37,8 @@ class BulkManageViewSet(ListModelMixin,
     pass
 
 
-class ReadOnlyViewSet(ListModelMixin,
+class ReadOnlyViewSet(SparseFieldsMixin,
+                      ListModelMixin,
                       RetrieveModelMixin,
                       GenericViewSet):
     """
@@ -1,2 +1,3 @@
 from .sdk import *
+from .pool import *
 from .factory import *
@@ -1,21 +1,19 @@
 from __future__ import annotations
 from typing import List
-from concurrent.futures import ProcessPoolExecutor
 from abc import ABC, abstractmethod
 from cmdb.settings import BASE_DIR
 from utils import logger
 import os
-from .sdk import PBExecutor, ModelResultsCollector, CallbackBase
+from .sdk import PBExecutor, FactsCollector, CallbackBase
+from .pool import CollectorPool
 
 __all__ = ['CollectorFactory', 'LinuxCollectorFactory', 'linux_collector_factory_run_with_process']
 
 
 def linux_collector_factory_run_with_process(addr: List, pb: List, log_str, extra_args=None, **kwargs):
     try:
-        with ProcessPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(LinuxCollectorFactory().exec, addr, pb, extra_args, **kwargs)
-            rst = future.result()
-            return rst
+        # 在常驻的采集进程池中执行，避免每次采集都创建进程和加载 ansible
+        return CollectorPool().run(LinuxCollectorFactory().exec, addr, pb, extra_args, **kwargs)
     except Exception as e:
         logger.error(f"unable to execute {log_str}, err: {e}")
         raise Exception(f"unable to execute {log_str}, err: {e}")
@@ -25,9 +23,15 @@ class CollectorFactory:
     def create_collector(self) -> Collector:
         pass
 
-    def exec(self, hosts, playbooks, extra_args=None, **kwargs) -> dict:
+    def exec(self, hosts, playbooks, extra_args=None, strict=True, fact_keys=None, **kwargs) -> dict:
+        """
+        执行采集
+        :param strict: 为 True 时任一主机失败或不可达即抛出异常，否则把错误记录在对应主机的结果中
+        :param fact_keys: 需要返回的事实名，None 表示返回所有 set_fact 的事实
+        """
         creator = self.create_collector()
-        creator.callback = ModelResultsCollector()
+        creator.strict = strict
+        creator.callback = FactsCollector(fact_keys)
         creator.hosts = hosts
         creator.playbooks = playbooks
         creator.execute(extra_args, **kwargs)
@@ -44,11 +48,14 @@ class LinuxCollectorFactory(CollectorFactory):
 
 
 class Collector(ABC):
-    _result_raw = {'success': {}, 'failed': {}, 'unreachable': {}}
-    _res = {}
-    _callback = None
-    hosts = []
-    _pbs = None
+    def __init__(self):
+        # 每次采集独立的结果，只包含本次执行的主机
+        self._result_raw = {'success': {}, 'failed': {}, 'unreachable': {}}
+        self._res = None
+        self._callback = None
+        self._pbs = None
+        self.hosts = []
+        self.strict = True
 
     @property
     def result(self):
@@ -76,6 +83,14 @@ class Collector(ABC):
             raise Exception('not valid callback')
         self._callback = callback
 
+    def handle_error(self, status: str, host: str, message: str):
+        """
+        处理主机的执行错误，严格模式下抛出异常，否则记录在主机结果中，不影响其他主机
+        """
+        if self.strict:
+            raise Exception(message)
+        self._result_raw[status][host] = {'error': message}
+
     @abstractmethod
     def execute(self, extra_args: dict = None, **kwargs):
         pass
@@ -103,28 +118,18 @@ class LinuxCollector(Collector):
         )(**kwargs)
 
     def set_ok(self):
-        for host, result in self._res.host_ok.items():
-            self._result_raw['success'][host] = {}
-            for task_name, fact in result.items():
-                if task_name == 'Gathering Facts':
-                    continue
-                af = fact._result.get('ansible_facts')
-                if not af:
-                    continue
-                for k, v in af.items():
-                    self._result_raw['success'][host][k] = v
+        for host, facts in self._res.host_ok.items():
+            self._result_raw['success'][host] = facts
 
     def set_failed(self):
-        for host, result in self._res.host_failed.items():
+        for host, errors in self._res.host_failed.items():
             self._result_raw['failed'][host] = {}
-            for task_name, fact in result.items():
-                if fact._result.get('stderr'):
-                    raise Exception(f'failed to execute task{task_name} on {host}, err:{fact._result.get("stderr")}')
+            for task_name, message in errors.items():
+                self.handle_error('failed', host, f'failed to execute task: {task_name} on {host}, err: {message}')
 
     def set_unreachable(self):
-        for host, result in self._res.host_unreachable.items():
+        for host, errors in self._res.host_unreachable.items():
             self._result_raw['unreachable'][host] = {}
-            for task_name, fact in result.items():
-                raise Exception(f'failed to execute task: {task_name}, err: host:{host} unreachable')
-                # if not fact._result:
-                #     break
+            for task_name, message in errors.items():
+                self.handle_error('unreachable', host, f'failed to execute task: {task_name}, err: host:{host} unreachable, {message}')
+                break
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import math
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+
+
+DOCUMENTATION = '''
+---
+module: host_metrics
+short_description: 一次读取主机的内存、cpu、负载和磁盘指标
+description:
+  - 读取 /proc/meminfo、/proc/stat、/proc/loadavg 和挂载点的 statvfs，以 ansible_facts 返回结构化的指标，
+    取代 free、/proc/stat、top、df 四个 shell 任务
+options:
+  fs_types:
+    description: 统计的文件系统类型
+    type: list
+    default: [ext2, ext4, xfs]
+'''
+
+RETURN = '''
+ansible_facts:
+  description: memory_usage、cpu_usage、cpu_load 和 disk_info，disk_info 以设备名为键
+  type: dict
+'''
+
+
+def read_meminfo():
+    """
+    读取内存信息，单位 kB
+    """
+    info = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            info[key] = int(value.split()[0])
+    return info
+
+
+def get_memory_usage():
+    """
+    内存使用率，与 free 的 used / total 一致
+    """
+    info = read_meminfo()
+    total = info['MemTotal']
+    cached = info.get('Cached', 0) + info.get('SReclaimable', 0)
+    used = total - info['MemFree'] - info.get('Buffers', 0) - cached
+    return round(used / total, 2) if total else 0.0
+
+
+def get_cpu_usage():
+    """
+    cpu 使用率，(user + system) / (user + system + idle)
+    """
+    with open('/proc/stat') as f:
+        for line in f:
+            if line.startswith('cpu '):
+                fields = [int(i) for i in line.split()[1:]]
+                user, system, idle = fields[0], fields[2], fields[3]
+                total = user + system + idle
+                return (user + system) / total if total else 0.0
+    return 0.0
+
+
+def get_cpu_load():
+    """
+    最近一分钟的平均负载
+    """
+    with open('/proc/loadavg') as f:
+        return round(float(f.read().split()[0]), 2)
+
+
+def get_disk_info(fs_types):
+    """
+    各设备的磁盘使用情况，与 df 一致，同一设备只统计第一个挂载点
+    """
+    disks = {}
+    with open('/proc/mounts') as f:
+        for line in f:
+            device, mount_point, fs_type = line.split()[:3]
+            if fs_type not in fs_types or device in disks:
+                continue
+            # 挂载点中的空白字符在 /proc/mounts 中被转义
+            mount_point = mount_point.replace('\\040', ' ')
+            try:
+                st = os.statvfs(mount_point)
+            except OSError:
+                continue
+            used = (st.f_blocks - st.f_bfree) * st.f_frsize
+            avail = st.f_bavail * st.f_frsize
+            gb = 1024 * 1024 * 1024
+            disks[device] = {
+                'disk_usage': used / gb,
+                'disk_avail': avail / gb,
+                # df 的 Use% 向上取整
+                'disk_used_percent': math.ceil(used * 100 / (used + avail)) / 100 if used + avail else 0.0
+            }
+    return disks
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            fs_types=dict(type='list', default=['ext2', 'ext4', 'xfs'])
+        ),
+        supports_check_mode=True
+    )
+
+    try:
+        facts = {
+            'memory_usage': get_memory_usage(),
+            'cpu_usage': get_cpu_usage(),
+            'cpu_load': get_cpu_load(),
+            'disk_info': get_disk_info(set(module.params['fs_types']))
+        }
+    except (IOError, OSError, ValueError, KeyError) as e:
+        module.fail_json(msg='unable to read host metrics: %s' % e, stderr=str(e))
+
+    module.exit_json(changed=False, ansible_facts=facts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from cmdb.configs import CFG
+from utils import SingletonMeta, logger
+import atexit
+import os
+
+__all__ = ['CollectorPool']
+
+
+def _warm_up():
+    """
+    工作进程的初始化函数，预先加载 ansible 的插件，避免每次采集时重复加载
+    """
+    from ansible.plugins.loader import become_loader, connection_loader, shell_loader
+    list(connection_loader.all(class_only=True))
+    list(shell_loader.all(class_only=True))
+    list(become_loader.all(class_only=True))
+
+
+def _ping() -> int:
+    """
+    健康检查任务
+    """
+    return os.getpid()
+
+
+class CollectorPool(metaclass=SingletonMeta):
+    """
+    常驻的采集进程池，工作进程启动时预先加载 ansible 插件，
+    执行一定数量的任务后整体替换为新的进程池，以回收工作进程中累积的内存
+    """
+
+    # 默认的任务超时时间，单位秒，一次采集最多 monitor_chunk_size 台主机并发执行，
+    # 单台主机的采集在数十秒内完成，留出 ssh 连接重试和排队的余量
+    default_timeout = 600
+
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 max_jobs: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        """
+        初始化
+        :param max_workers: 工作进程数
+        :param max_jobs: 进程池执行多少个任务后回收
+        :param timeout: 等待任务结果的超时时间，单位秒，超时后回收卡住的工作进程
+        """
+        self._max_workers = max_workers or CFG.getint('ansible', 'pool_workers', fallback=4)
+        self._max_jobs = max_jobs or CFG.getint('ansible', 'pool_max_jobs', fallback=200)
+        if timeout is None:
+            timeout = CFG.getfloat('ansible', 'pool_timeout', fallback=self.default_timeout)
+        self._timeout = timeout
+        self._executor = None
+        self._jobs = 0
+        # 已提交且未完成的任务数，用于健康检查判断进程池是否空闲
+        self._pending = 0
+        self._lock = Lock()
+        atexit.register(self.shutdown)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        """
+        创建进程池，工作进程启动时执行预热
+        """
+        return ProcessPoolExecutor(max_workers=self._max_workers, initializer=_warm_up)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        获取当前进程池，任务数达到上限时替换为新的进程池，旧进程池执行完已提交的任务后退出
+        """
+        with self._lock:
+            if self._executor is None or self._jobs >= self._max_jobs:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+                self._jobs = 0
+            self._jobs += 1
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor, terminate: bool = False):
+        """
+        丢弃已损坏的进程池，下次提交时重新创建
+        :param terminate: 是否结束工作进程，用于回收卡住的工作进程，进程池中其他未完成的任务会失败
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            processes = getattr(executor, '_processes', None) or {}
+            for process in list(processes.values()):
+                process.terminate()
+        executor.shutdown(wait=False)
+
+    def _on_done(self, _: Future):
+        """
+        任务完成的回调，减少未完成的任务数
+        """
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, fn: Callable, *args: Any, **kwargs: Any):
+        """
+        提交任务，返回执行任务的进程池和任务的 future
+        """
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            logger.warning('collector pool is broken, recreating')
+            self._reset(executor)
+            executor = self._get_executor()
+            future = executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._on_done)
+        return executor, future
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """
+        提交任务，进程池损坏时重建后重试一次
+        :param fn: 可被序列化的函数
+        :return: 任务的 future
+        """
+        return self._submit(fn, *args, **kwargs)[1]
+
+    def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        提交任务并等待结果
+        :param fn: 可被序列化的函数
+        :return: 任务结果
+        """
+        executor, future = self._submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self._timeout)
+        except BrokenProcessPool:
+            # 工作进程异常退出，丢弃进程池，不影响之后的任务
+            self._reset(executor)
+            raise
+        except TimeoutError:
+            # 任务超时，工作进程可能已卡住，取消任务并回收进程池，之后的任务使用新的进程池
+            logger.error(f'collector pool job timed out after {self._timeout}s, recycling')
+            future.cancel()
+            self._reset(executor, terminate=True)
+            raise
+
+    def check_health(self, timeout: float = 10) -> bool:
+        """
+        健康检查，空闲的工作进程无法在超时时间内响应时丢弃进程池，
+        有任务在执行时工作进程繁忙，检查任务排队超时不代表进程池异常，不做检查，卡住的任务由 run 的超时回收
+        :param timeout: 超时时间，单位秒
+        :return: 是否健康
+        """
+        with self._lock:
+            busy = self._pending > 0
+        if busy:
+            return True
+
+        executor = self._get_executor()
+        try:
+            executor.submit(_ping).result(timeout=timeout)
+        except Exception as e:
+            logger.error(f'collector pool health check failed, err: {e}')
+            self._reset(executor, terminate=True)
+            return False
+        return True
+
+    def shutdown(self, wait: bool = True):
+        """
+        关闭进程池，等待已提交的任务执行完毕
+        :param wait: 是否等待
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -6,9 +6,10 @@ from ansible.parsing.dataloader import DataLoader
 from ansible.inventory.manager import InventoryManager
 from ansible.vars.manager import VariableManager
 from typing import List, Type
+from threading import Lock
 from monitor.modified_ansible.custom_pb_executor import PlaybookExecutor
 
-__all__ = ['ModelResultsCollector', 'PBExecutor']
+__all__ = ['ModelResultsCollector', 'FactsCollector', 'PBExecutor']
 
 
 class ModelResultsCollector(CallbackBase):
@@ -37,6 +38,57 @@ class ModelResultsCollector(CallbackBase):
         self.gather_result('failed', rst)
 
 
+class FactsCollector(CallbackBase):
+    """
+    执行过程中流式提取结果的回调，每台主机只保留 set_fact 设置的事实和错误信息，不保留 TaskResult，
+    收集阶段 Gathering Facts 的大量事实直接丢弃
+    """
+
+    def __init__(self, fact_keys=None, *args, **kwargs):
+        """
+        初始化
+        :param fact_keys: 需要保留的事实名，None 表示保留所有 set_fact 的事实
+        """
+        super(FactsCollector, self).__init__(*args, **kwargs)
+        self.fact_keys = frozenset(fact_keys) if fact_keys is not None else None
+        # 主机对应事实字典
+        self.host_ok = {}
+        # 主机对应任务名到错误输出的字典
+        self.host_unreachable = {}
+        self.host_failed = {}
+
+    def v2_runner_on_ok(self, rst):
+        # 收集阶段成功不代表主机成功，之后的任务仍可能失败或不可达
+        if rst.task_name == 'Gathering Facts':
+            return
+        facts = self.host_ok.setdefault(rst._host.get_name(), {})
+        ansible_facts = rst._result.get('ansible_facts')
+        if not ansible_facts:
+            return
+        for k, v in ansible_facts.items():
+            if self.fact_keys is None or k in self.fact_keys:
+                facts[k] = v
+
+    @staticmethod
+    def get_error_message(result: dict) -> str:
+        """
+        获取任务结果中的错误信息，stderr 为空时使用模块返回的 msg，都没有时使用返回码
+        """
+        return result.get('stderr') or result.get('msg') or f'rc: {result.get("rc")}'
+
+    def v2_runner_on_unreachable(self, rst):
+        errors = self.host_unreachable.setdefault(rst._host.get_name(), {})
+        errors[rst.task_name] = self.get_error_message(rst._result)
+
+    def v2_runner_on_failed(self, rst, ignore_errors=False):
+        errors = self.host_failed.setdefault(rst._host.get_name(), {})
+        errors[rst.task_name] = self.get_error_message(rst._result)
+
+
+# ansible 的命令行参数等状态是进程全局的，同一进程中的执行需要串行
+_execute_lock = Lock()
+
+
 class PBExecutor:
     def __init__(
             self,
@@ -47,11 +99,16 @@ class PBExecutor:
             inventory_path: str = None):
         self.pb = playbooks
         self.inventory = inventory_path if inventory_path else 'localhost'
-        self.extra_vars = extra_vars if extra_vars else {}
+        # 复制一份，执行时加入的变量不影响调用方
+        self.extra_vars = dict(extra_vars) if extra_vars else {}
         self.hosts = hosts
         self.cb = cb
 
     def __call__(self, *args, **kwargs):
+        with _execute_lock:
+            return self._execute(**kwargs)
+
+    def _execute(self, **kwargs):
         loader = DataLoader()
         user = kwargs.get('user', 'root')
         become = kwargs.get('become', False)
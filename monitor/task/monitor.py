@@ -1,3 +1,5 @@
+from collections import defaultdict
+from django.db import transaction
 from django.utils import timezone
 from asset.models.mapping import *
 from utils import CreateObjectError, logger
@@ -5,51 +7,120 @@ from cmdb.configs import CFG
 from asset.models import *
 from monitor.event import BaseTask
 from monitor.factory import linux_collector_factory_run_with_process
+from monitor.pool import CollectorPool
 
 __all__ = ['MonitorSync']
 
 
 class MonitorSync(BaseTask):
+    # 每次 playbook 执行采集的最大主机数，与 PBExecutor 的 forks 一致
+    chunk_size = CFG.getint('ansible', 'monitor_chunk_size', fallback=100)
+
     @property
     def name(self):
         return '[同步监控数据]'
 
     def _run(self):
+        # 同步前检查采集进程池，无响应的进程池会被丢弃并在提交时重建
+        CollectorPool().check_health()
+
         pb = CFG.get('ansible', 'monitor_pb')
-        ips = IP.dao.get_queryset(used_to_sync=True)
-        metrics = Metric.dao.get_queryset()
+        ips = list(IP.dao.get_queryset(used_to_sync=True))
+        hosts = Host.dao.get_many(ip.host for ip in ips if ip.host)
+        metrics = list(Metric.dao.get_queryset())
+
+        # 同一次执行只能使用一个登录用户，按用户分组后分块，每块执行一次 playbook
+        targets_by_user = defaultdict(list)
         for ip in ips:
-            host_obj: Host = Host.dao.get_obj(uuid=ip.host)
-            user = host_obj.username
-            addr = f'{ip.address}:{host_obj.ssh_port}'
+            host_obj = hosts.get(ip.host)
+            if host_obj is None:
+                logger.warning(f'unable to sync metric data for ip:{ip.address}, host:{ip.host} not found')
+                continue
+            targets_by_user[host_obj.username].append((ip, host_obj))
+
+        for user, targets in targets_by_user.items():
+            for start in range(0, len(targets), self.chunk_size):
+                self.sync_chunk(targets[start:start + self.chunk_size], metrics, pb, user)
+
+    def sync_chunk(self, targets: list, metrics: list, pb: str, user: str):
+        """
+        一次 playbook 执行采集一块主机，按主机拆分结果后一次写入监控数据
+        :param targets: ip 和主机对象的列表
+        :param metrics: 监控指标列表
+        :param pb: playbook 路径
+        :param user: 登录用户
+        """
+        addrs = [f'{ip.address}:{host_obj.ssh_port}' for ip, host_obj in targets]
+        try:
             host_info = linux_collector_factory_run_with_process(
-                [addr], [pb], 'host', user=user)
-            for m in metrics:
-                parser = self.parser_factory(m.name)
-                try:
-                    value = host_info['success'][ip.address][self.get_metric_name(m)]
-                except KeyError as e:
-                    print(f'holly fuck {host_info}')
-                    logger.warning(
-                        f'unable to create monitor_data with {host_info} due to err {e}')
-                    continue
-                rst = parser(value)
-                if m.type == MetricTypeMapping.index('disk'):
-                    kwargs = []
-                    for k, v in rst.items():
-                        value = v.get(m.name)
-                        one_kwargs = self.new_kwargs(
-                            value, m.uuid, host_obj.uuid, k)
-                        kwargs.append(one_kwargs)
-                else:
-                    kwargs = [
-                        self.new_kwargs(
-                            value, m.uuid, host_obj.uuid)]
-                try:
-                    MonitorData.dao.bulk_create_obj(kwargs)
-                except CreateObjectError as e:
-                    logger.error(
-                        f'unable to sync metric data for host:{host_obj.uuid}, ip:{ip.address} due to err: {e}')
+                addrs, [pb], 'monitor data sync', strict=False,
+                fact_keys={self.get_metric_name(m) for m in metrics}, user=user)
+        except Exception as e:
+            logger.error(f'unable to sync metric data for {len(addrs)} hosts due to err: {e}')
+            return
+
+        kwargs_by_host = []
+        for ip, host_obj in targets:
+            facts = host_info['success'].get(ip.address)
+            if facts is None:
+                result = host_info['failed'].get(ip.address) or host_info['unreachable'].get(ip.address) or {}
+                error = result.get('error', 'no result returned')
+                logger.warning(f'unable to sync metric data for host:{host_obj.uuid}, ip:{ip.address} due to err: {error}')
+                continue
+            kwargs = self.new_kwargs_list(facts, metrics, host_obj, ip)
+            if kwargs:
+                kwargs_by_host.append((host_obj, ip, kwargs))
+
+        if not kwargs_by_host:
+            return
+        try:
+            self.create_monitor_data([k for _, _, kwargs in kwargs_by_host for k in kwargs])
+            return
+        except CreateObjectError as e:
+            logger.warning(f'unable to sync metric data for {len(kwargs_by_host)} hosts at once due to err: {e}, '
+                           f'retrying host by host')
+
+        # 整块写入失败时逐台主机写入，一台主机的错误数据不影响其他主机
+        for host_obj, ip, kwargs in kwargs_by_host:
+            try:
+                self.create_monitor_data(kwargs)
+            except CreateObjectError as e:
+                logger.error(f'unable to sync metric data for host:{host_obj.uuid}, ip:{ip.address} due to err: {e}')
+
+    @staticmethod
+    def create_monitor_data(kwargs: list):
+        """
+        在单独的保存点中批量写入监控数据，写入失败只回滚本次写入，不影响外层事务中的其他写入
+        :param kwargs: 监控数据字段字典的列表
+        """
+        with transaction.atomic():
+            MonitorData.dao.bulk_create_obj(kwargs)
+
+    def new_kwargs_list(self, facts: dict, metrics: list, host_obj, ip) -> list:
+        """
+        把一台主机的采集结果转换为监控数据
+        :param facts: 主机的采集结果
+        :param metrics: 监控指标列表
+        :param host_obj: 主机对象
+        :param ip: ip 对象
+        :return: 监控数据字段字典的列表
+        """
+        kwargs = []
+        for m in metrics:
+            parser = self.parser_factory(m.name)
+            try:
+                value = facts[self.get_metric_name(m)]
+            except KeyError as e:
+                logger.warning(
+                    f'unable to create monitor_data for host:{host_obj.uuid}, ip:{ip.address} due to err {e}')
+                continue
+            rst = parser(value)
+            if m.type == MetricTypeMapping.index('disk'):
+                for k, v in rst.items():
+                    kwargs.append(self.new_kwargs(v.get(m.name), m.uuid, host_obj.uuid, k))
+            else:
+                kwargs.append(self.new_kwargs(value, m.uuid, host_obj.uuid))
+        return kwargs
 
     @staticmethod
     def get_metric_name(m):
@@ -70,6 +141,9 @@ class MonitorSync(BaseTask):
 
     @staticmethod
     def disk_monitor_data_parser(s):
+        # host_metrics 模块已按设备返回结构化数据，旧的 playbook 返回 df 的输出文本
+        if isinstance(s, dict):
+            return s
         s = s.replace('\n', ' ')
         data_list = s.split(' ')
         data_list = [i for i in data_list if i and i != ',']
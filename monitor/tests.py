@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+from .sdk import FactsCollector
+
+
+def _result(host: str, task_name: str, result: dict):
+    """
+    构造回调收到的任务结果
+    """
+    return SimpleNamespace(_host=SimpleNamespace(get_name=lambda: host), task_name=task_name, _result=result)
+
+
+class FactsCollectorTest(SimpleTestCase):
+    """
+    流式提取结果的回调
+    """
+
+    def test_failed_after_gathering_facts(self):
+        callback = FactsCollector(fact_keys={'cpu_usage'})
+        callback.v2_runner_on_ok(_result('10.0.0.1', 'Gathering Facts', {'ansible_facts': {'ansible_os_family': 'RedHat'}}))
+        callback.v2_runner_on_failed(_result('10.0.0.1', 'host_metrics', {'msg': 'module failure'}))
+
+        self.assertNotIn('10.0.0.1', callback.host_ok)
+        self.assertEqual(callback.host_failed['10.0.0.1'], {'host_metrics': 'module failure'})
+
+    def test_unreachable_after_gathering_facts(self):
+        callback = FactsCollector()
+        callback.v2_runner_on_ok(_result('10.0.0.1', 'Gathering Facts', {'ansible_facts': {}}))
+        callback.v2_runner_on_unreachable(_result('10.0.0.1', 'host_metrics', {'msg': 'ssh timeout'}))
+
+        self.assertNotIn('10.0.0.1', callback.host_ok)
+        self.assertIn('10.0.0.1', callback.host_unreachable)
+
+    def test_ok_keeps_requested_facts(self):
+        callback = FactsCollector(fact_keys={'cpu_usage'})
+        callback.v2_runner_on_ok(_result('10.0.0.1', 'Gathering Facts', {'ansible_facts': {'ansible_os_family': 'RedHat'}}))
+        callback.v2_runner_on_ok(_result('10.0.0.1', 'host_metrics', {'ansible_facts': {'cpu_usage': 12.5, 'other': 1}}))
+
+        self.assertEqual(callback.host_ok, {'10.0.0.1': {'cpu_usage': 12.5}})
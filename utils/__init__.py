@@ -1,5 +1,7 @@
+from .codec import *
 from .general import *
 from .datetime import *
 from .dao import *
+from .cache import *
 from .metaclass import *
 from .decorator import *
@@ -0,0 +1,224 @@
+from typing import Any, Optional, Hashable
+from collections import OrderedDict
+from threading import Lock
+import pickle
+import time
+
+
+__all__ = [
+    'LRUCache',
+    'RedisCache',
+    'get_cache',
+    'is_shared_cache',
+    'get_generation',
+    'bump_generation'
+]
+
+
+class LRUCache:
+    """
+    线程安全的进程内 LRU 缓存，支持过期时间
+    """
+
+    def __init__(self, max_size: int = 1024, timeout: Optional[float] = None):
+        """
+        初始化
+        :param max_size: 最大条目数，0 表示不限制
+        :param timeout: 默认过期时间，单位秒，None 表示不过期
+        """
+        self._max_size = max_size
+        self._timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        获取缓存值，不存在或已过期则返回默认值
+        """
+        with self._lock:
+            try:
+                value, expire_at = self._data[key]
+            except KeyError:
+                return default
+
+            if expire_at is not None and expire_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, timeout: Optional[float] = None) -> None:
+        """
+        设置缓存值，超出容量时淘汰最久未使用的条目
+        :param timeout: 过期时间，单位秒，默认使用初始化时的过期时间
+        """
+        timeout = self._timeout if timeout is None else timeout
+        expire_at = time.monotonic() + timeout if timeout else None
+
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while self._max_size and len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """
+        删除缓存值
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: Hashable) -> int:
+        """
+        对整数缓存值加一并返回，不存在时从 0 开始
+        """
+        with self._lock:
+            value = self._data.get(key, (0, None))[0] + 1
+            self._data[key] = (value, None)
+            self._data.move_to_end(key)
+            return value
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """
+    Redis 缓存，接口与 LRUCache 一致，多个进程共享
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 key_prefix: str = 'cmdb', timeout: Optional[float] = None):
+        """
+        初始化
+        :param host: Redis 地址
+        :param port: Redis 端口
+        :param db: Redis 库
+        :param key_prefix: 键前缀
+        :param timeout: 默认过期时间，单位秒，None 表示不过期
+        """
+        # 仅在使用 Redis 缓存时才需要安装 redis
+        import redis
+
+        self._client = redis.Redis(host=host, port=int(port), db=int(db))
+        self._key_prefix = key_prefix
+        self._timeout = timeout
+
+    def _make_key(self, key: Hashable) -> str:
+        return f'{self._key_prefix}:{key}'
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        获取缓存值，不存在或已过期则返回默认值
+        """
+        value = self._client.get(self._make_key(key))
+        if value is None:
+            return default
+        # incr 写入的是整数文本，其余值使用 pickle 序列化
+        if value.isdigit():
+            return int(value)
+        return pickle.loads(value)
+
+    def set(self, key: Hashable, value: Any, timeout: Optional[float] = None) -> None:
+        """
+        设置缓存值
+        :param timeout: 过期时间，单位秒，默认使用初始化时的过期时间
+        """
+        timeout = self._timeout if timeout is None else timeout
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._client.set(self._make_key(key), value, px=int(timeout * 1000) if timeout else None)
+
+    def delete(self, key: Hashable) -> None:
+        """
+        删除缓存值
+        """
+        self._client.delete(self._make_key(key))
+
+    def incr(self, key: Hashable) -> int:
+        """
+        对整数缓存值加一并返回，不存在时从 0 开始
+        """
+        return self._client.incr(self._make_key(key))
+
+    def clear(self) -> None:
+        """
+        清空带前缀的缓存
+        """
+        keys = list(self._client.scan_iter(f'{self._key_prefix}:*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+# 缓存后端，第一次使用时根据 settings.CACHE_BACKEND 创建
+_cache = None
+_cache_lock = Lock()
+
+# 进程内后端时各模型的数据版本号，不淘汰以免版本号回退
+_generations = LRUCache(max_size=0)
+
+
+def get_cache():
+    """
+    获取配置的缓存后端
+    settings.CACHE_BACKEND 的 BACKEND 为 lru 时使用进程内 LRU 缓存，为 redis 时使用 Redis 缓存，
+    OPTIONS 为后端的初始化参数
+    :return: 缓存后端
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from django.conf import settings
+
+                config = getattr(settings, 'CACHE_BACKEND', {})
+                backend = config.get('BACKEND', 'lru')
+                options = config.get('OPTIONS', {})
+                if backend == 'redis':
+                    _cache = RedisCache(**options)
+                elif backend == 'lru':
+                    _cache = LRUCache(**options)
+                else:
+                    raise ValueError(f'Unknown cache backend: {backend}')
+    return _cache
+
+
+def is_shared_cache() -> bool:
+    """
+    缓存后端和数据版本号是否由各进程共享，进程内后端时其他进程的数据变更不会使本进程的缓存失效，
+    响应缓存、条件请求和对象缓存等依赖版本号失效的缓存只在共享后端时开启
+    :return: 是否共享
+    """
+    return isinstance(get_cache(), RedisCache)
+
+
+def _get_generation_store():
+    """
+    数据版本号的存储，Redis 后端时保存在 Redis 中，使各进程的缓存同时失效
+    """
+    return get_cache() if is_shared_cache() else _generations
+
+
+def get_generation(key: str) -> int:
+    """
+    获取数据版本号
+    :param key: 版本号的键，一般为模型标签
+    :return: 版本号
+    """
+    return _get_generation_store().get(f'generation:{key}', 0)
+
+
+def bump_generation(key: str) -> int:
+    """
+    递增数据版本号
+    :param key: 版本号的键，一般为模型标签
+    :return: 新的版本号
+    """
+    return _get_generation_store().incr(f'generation:{key}')
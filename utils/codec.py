@@ -0,0 +1,121 @@
+from typing import Any, Union
+from datetime import datetime
+from django.utils import timezone
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+import msgpack
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+__all__ = [
+    'JSON_BACKEND',
+    'json_dumps',
+    'json_loads',
+    'msgpack_dumps',
+    'msgpack_loads'
+]
+
+
+# 使用的 json 库，优先使用 orjson，未安装时使用标准库
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# 处理标准库和 orjson 无法直接编码的类型，如 Decimal、UUID、QuerySet 和惰性字符串
+_encoder = JSONEncoder()
+
+
+def _default(o: Any) -> Any:
+    """
+    编码无法直接编码的对象，时间按 REST_FRAMEWORK 的 DATETIME_FORMAT 格式化，其余交给框架的编码器
+    """
+    if isinstance(o, datetime):
+        output_format = api_settings.DATETIME_FORMAT
+        if timezone.is_aware(o):
+            o = timezone.localtime(o)
+        if output_format is None or output_format.lower() == 'iso-8601':
+            value = o.isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return o.strftime(output_format)
+    return _encoder.default(o)
+
+
+if orjson is not None:
+    # 时间交给 _default 按配置格式化，允许非字符串的键
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def json_dumps(obj: Any) -> bytes:
+        """
+        编码为紧凑的 utf-8 json
+        :param obj: 对象
+        :return: json 字节串
+        """
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def json_loads(s: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """
+        解码 json
+        :param s: json 字符串或字节串
+        :return: 对象
+        """
+        return orjson.loads(s)
+
+else:
+    class _Encoder(json.JSONEncoder):
+        def default(self, o):
+            return _default(o)
+
+    def json_dumps(obj: Any) -> bytes:
+        """
+        编码为紧凑的 utf-8 json
+        :param obj: 对象
+        :return: json 字节串
+        """
+        return json.dumps(obj, cls=_Encoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def json_loads(s: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """
+        解码 json
+        :param s: json 字符串或字节串
+        :return: 对象
+        """
+        if isinstance(s, memoryview):
+            s = s.tobytes()
+        return json.loads(s)
+
+
+def _msgpack_default(o: Any) -> Any:
+    """
+    编码 msgpack 无法直接编码的对象，时间编码为秒级时间戳，其余与 json 一致
+    """
+    if isinstance(o, datetime):
+        if timezone.is_naive(o):
+            o = timezone.make_aware(o)
+        return o.timestamp()
+    return _encoder.default(o)
+
+
+def msgpack_dumps(obj: Any) -> bytes:
+    """
+    编码为 msgpack
+    :param obj: 对象
+    :return: msgpack 字节串
+    """
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+def msgpack_loads(s: Union[bytes, bytearray, memoryview]) -> Any:
+    """
+    解码 msgpack，数据不合法时抛出 ValueError
+    :param s: msgpack 字节串
+    :return: 对象
+    """
+    try:
+        return msgpack.unpackb(s, raw=False)
+    except msgpack.UnpackException as e:
+        raise ValueError(str(e)) from e
@@ -1,8 +1,10 @@
-from typing import Any, List, Union, Optional
+from typing import Any, Dict, Iterable, List, Union, Optional
+from django.db import transaction
 from django.db.models import Q, QuerySet
 from django.db.utils import Error
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from utils import get_datetime_with_tz
+from .cache import LRUCache, get_generation, is_shared_cache
 
 
 __all__ = [
@@ -62,18 +64,99 @@ class DAO:
         """
         self._model = model
 
+        # 按 uuid 查询的对象缓存，由模型的 dao_cache_size、dao_cache_timeout 开启，缓存后端共享时生效
+        cache_size = getattr(model, 'dao_cache_size', 0)
+        self._cache = LRUCache(cache_size, getattr(model, 'dao_cache_timeout', None)) if cache_size else None
+
+    def _use_cache(self) -> bool:
+        """
+        是否使用对象缓存，数据版本号只在本进程有效时其他进程的更新无法使缓存失效，不使用缓存
+        """
+        return self._cache is not None and is_shared_cache()
+
+    def _get_cache_key(self, uuid: str) -> tuple:
+        """
+        对象缓存的键，包含模型的数据版本号，模型数据变更后旧缓存自然失效
+        """
+        return uuid, get_generation(self._model._meta.label)
+
+    def _get_cached(self, uuid: str) -> Any:
+        """
+        从缓存获取对象，每次返回新的模型对象，调用方的修改不会影响缓存
+        """
+        values = self._cache.get(self._get_cache_key(uuid))
+        if values is None:
+            return None
+        db, field_names, field_values = values
+        return self._model.from_db(db, field_names, field_values)
+
+    def _set_cached(self, obj) -> None:
+        """
+        缓存对象的字段值，延迟加载的字段未加载时不缓存
+        事务中读到的可能是未提交的数据，事务提交后才写入缓存，回滚则不写入
+        """
+        attnames = [f.attname for f in self._model._meta.concrete_fields]
+        if any(name not in obj.__dict__ for name in attnames):
+            return
+        key = self._get_cache_key(obj.uuid)
+        values = (obj._state.db, attnames, [obj.__dict__[name] for name in attnames])
+        transaction.on_commit(lambda: self._cache.set(key, values), using=obj._state.db)
+
+    def invalidate(self, *objects: Any) -> None:
+        """
+        删除对象缓存
+        :param objects: 模型对象列表
+        """
+        if self._cache is None:
+            return
+        for obj in objects:
+            self._cache.delete(self._get_cache_key(obj.uuid))
+
     def get_obj(self, *args: Q, **kwargs: Any) -> Any:
         """
-        过滤获取单个对象
+        过滤获取单个对象，只按 uuid 查询且模型开启了对象缓存时优先读取缓存
         :param args: 查询对象列表
         :param kwargs: 字段过滤字典
         :return: 模型对象
         """
+        use_cache = self._use_cache() and not args and kwargs.keys() == {'uuid'}
+        if use_cache:
+            obj = self._get_cached(kwargs['uuid'])
+            if obj is not None:
+                return obj
+
         try:
-            return self._model.objects.get(*args, **kwargs)
+            obj = self._model.objects.get(*args, **kwargs)
         except (ObjectDoesNotExist, MultipleObjectsReturned) as e:
             raise QueryObjectError(*e.args)
 
+        if use_cache:
+            self._set_cached(obj)
+        return obj
+
+    def get_many(self, uuids: Iterable[str]) -> Dict[str, Any]:
+        """
+        按 uuid 批量获取对象，缓存命中的直接返回，未命中的用一条 uuid__in 查询获取
+        :param uuids: uuid 列表
+        :return: uuid 对应模型对象的字典，不存在的 uuid 不包含在内
+        """
+        result = {}
+        missing = set(uuids)
+        use_cache = self._use_cache()
+        if use_cache:
+            for uuid in list(missing):
+                obj = self._get_cached(uuid)
+                if obj is not None:
+                    result[uuid] = obj
+                    missing.discard(uuid)
+
+        if missing:
+            for obj in self._model.objects.filter(uuid__in=missing):
+                result[obj.uuid] = obj
+                if use_cache:
+                    self._set_cached(obj)
+        return result
+
     def get_queryset(self, *args: Q, empty: Optional[bool] = True, **kwargs: Any) -> QuerySet:
         """
         过滤获取一个查询集
@@ -112,6 +195,7 @@ class DAO:
             raise CreateObjectError(*e.args)
 
         obj.post_create()
+        self._model.mark_changed()
         return obj
 
     def bulk_create_obj(self, fields_list: List[dict]) -> Any:
@@ -120,18 +204,16 @@ class DAO:
         :param fields_list: 字段对应值字典的列表
         :return: 模型对象列表
         """
-        objects = []
-        for fields in fields_list:
-            self._model.pre_create(fields)
-            objects.append(self._model(**fields))
+        self._model.pre_create_many(fields_list)
+        objects = [self._model(**fields) for fields in fields_list]
 
         try:
             objects = self._model.objects.bulk_create(objects)
         except Error as e:
             raise CreateObjectError(*e.args)
 
-        for obj in objects:
-            obj.post_create()
+        self._model.post_create_many(objects)
+        self._model.mark_changed()
         return objects
 
     @staticmethod
@@ -150,29 +232,35 @@ class DAO:
             obj.save()
         except Error as e:
             raise UpdateObjectError(*e.args)
+        type(obj).dao.invalidate(obj)
 
         obj.post_update()
+        type(obj).mark_changed()
         return obj
 
     def bulk_update_obj(self, objects: Union[list, QuerySet], **fields) -> Union[list, QuerySet]:
         """
-        批量修改指定对象
+        批量修改指定对象，所有对象的新值相同，用一条 pk__in 的 UPDATE 语句完成
         :param objects: 模型对象列表
         :param fields: 字段对应值字典
         :return: 模型对象列表或查询集
         """
+        if not objects:
+            return objects
+
+        self._model.pre_update_many(objects, [fields] * len(objects))
         for obj in objects:
-            obj.pre_update(fields)
             for k, v in fields.items():
                 setattr(obj, k, v)
 
         try:
-            self._model.objects.bulk_update(objects, fields.keys())
+            self._model.objects.filter(pk__in=[obj.pk for obj in objects]).update(**fields)
         except Error as e:
             raise UpdateObjectError(*e.args)
+        self.invalidate(*objects)
 
-        for obj in objects:
-            obj.post_update()
+        self._model.post_update_many(objects)
+        self._model.mark_changed()
         return objects
 
     @staticmethod
@@ -191,7 +279,9 @@ class DAO:
                 obj.delete()
         except Error as e:
             raise DeleteObjectError(*e.args)
+        type(obj).dao.invalidate(obj)
         obj.post_delete()
+        type(obj).mark_changed()
 
     def bulk_delete_obj(self, *args: Q, **kwargs: Any) -> int:
         """
@@ -200,7 +290,32 @@ class DAO:
         :param kwargs: 字段过滤字典
         :return: 成功删除对象数
         """
-        obj_qs = self.get_queryset(*args, **kwargs)
-        for obj in obj_qs:
-            self.delete_obj(obj)
-        return len(obj_qs)
+        objects = list(self.get_queryset(*args, **kwargs))
+        return self.delete_objs(objects)
+
+    def delete_objs(self, objects: list) -> int:
+        """
+        批量删除指定对象，自动区分并进行软删除，只执行一条删除语句
+        :param objects: 模型对象列表
+        :return: 成功删除对象数
+        """
+        if not objects:
+            return 0
+
+        # 删除和后处理中的级联操作在同一个事务中
+        with transaction.atomic():
+            self._model.pre_delete_many(objects)
+
+            try:
+                queryset = self._model.objects.filter(pk__in=[obj.pk for obj in objects])
+                if hasattr(self._model, 'deleted_at'):
+                    queryset.update(deleted_at=get_datetime_with_tz())
+                else:
+                    queryset.delete()
+            except Error as e:
+                raise DeleteObjectError(*e.args)
+            self.invalidate(*objects)
+
+            self._model.post_delete_many(objects)
+        self._model.mark_changed()
+        return len(objects)
@@ -1,8 +1,8 @@
 from typing import AnyStr, Union, Optional
 from importlib import import_module
 from django.conf import settings
+from .codec import json_dumps, json_loads
 import bcrypt
-import json
 import hashlib
 import uuid
 import logging
@@ -33,7 +33,7 @@ def safe_json_dumps(d: Union[dict, list]) -> str:
         return ''
 
     try:
-        return json.dumps(d)
+        return json_dumps(d).decode('utf-8')
     # 以下两种异常能捕捉此处的所有可能
     except (TypeError, ValueError):
         return ''
@@ -46,7 +46,7 @@ def safe_json_loads(s: Union[AnyStr, bytearray]) -> Union[dict, list]:
     :return: 字典
     """
     try:
-        obj = json.loads(s)
+        obj = json_loads(s)
     # 以下两种异常能捕捉此处的所有可能
     except (TypeError, ValueError):
         return {}
@@ -1,4 +1,5 @@
 from typing import Optional
+from threading import RLock
 
 
 __all__ = [
@@ -12,8 +13,12 @@ class SingletonMeta(type):
     """
 
     _instance: Optional[type] = None
+    # 创建实例的锁，避免多个线程同时首次调用时创建出多个实例，可重入以允许在初始化中创建其他单例
+    _lock = RLock()
 
     def __call__(cls, *args, **kwargs) -> type:
         if cls._instance is None:
-            cls._instance = super().__call__(*args, **kwargs)
+            with SingletonMeta._lock:
+                if cls._instance is None:
+                    cls._instance = super().__call__(*args, **kwargs)
         return cls._instance